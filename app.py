@@ -1,17 +1,27 @@
 import streamlit as st
 import requests
 import base64
-import PyPDF2
-import docx
-import io
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from document_backend import PARSER_VERSION, PageRangeError, document_kind, extract_document
+from tts_backend import AUDIO_FORMATS, stream_preview_bytes, stream_long_speech, cache_stats, cached_chunk_count
+from audio_player import client_audio_format
+from jobs import get_job_executor
+from audio_store import get_audio_store
+from http_client import start_warm_up
+from metrics import start_exporter
+from rate_limiter import report_waits
+from description_cache import get_description_cache
 
 # Import functions from image_backend.py
 try:
-    from image_backend import look_at_photo, encode_image_from_bytes
+    from image_backend import describe_photo, stream_photo_description, encode_image_from_bytes
 except ImportError:
     st.error("🚨 FATAL ERROR: image_backend.py not found. Image analysis features will fail.")
-    def encode_image_from_bytes(byte_data): return base64.b64encode(byte_data).decode('utf-8')
-    def look_at_photo(base64_image, upload=False): return "Error: image_backend.py not loaded."
+    def encode_image_from_bytes(byte_data, detail="auto"): return base64.b64encode(byte_data).decode('utf-8')
+    def describe_photo(base64_image, upload=False, detail="auto"): raise RuntimeError("image_backend.py not loaded.")
+    def stream_photo_description(base64_image, upload=False, detail="auto"): raise RuntimeError("image_backend.py not loaded.")
 
 # --- Configuration ---
 st.set_page_config(
@@ -30,10 +40,17 @@ VOICE_OPTIONS = {
     "Liam (m)": "liam", "Onyx (m)": "onyx", "Puck (m)": "puck",
     "Adam (m)": "adam", "Santa (m)": "santa"
 }
-LEMONFOX_API_URL = "https://api.lemonfox.ai/v1/audio/speech"
+AUDIO_FORMAT_OPTIONS = {
+    "MP3 (plays everywhere)": "mp3", "AAC (smaller)": "aac", "Opus (smallest)": "opus"
+}
 TTS_MODEL = "tts-1"
-MAX_CHAR_LIMIT = 30000
+MAX_CHAR_LIMIT = 200000 # Long texts are synthesized in parallel chunks
 DEFAULT_SOURCE_INFO = "Enter text, upload a file, or use an image."
+VISION_DETAIL = "auto" # OpenAI vision detail level ("low", "high" or "auto"); images are downscaled to match
+JOB_POLL_SECONDS = 1 # How often a running conversion's progress is refreshed
+DESCRIPTION_POLL_SECONDS = 0.5 # How often an image description is refreshed while it is being written
+IMAGE_BATCH_WORKERS = 4 # Images of one multi-image upload (e.g. worksheet pages) described at once
+QUEUED_MESSAGE = "⏳ Many people are using the app right now. Your request is queued and should start in about {seconds:.0f} seconds."
 
 # Constants for Radio Button Options
 IMAGE_MODE_TEXT_FIRST = "Process image into text first"
@@ -55,34 +72,72 @@ if missing_keys:
     keys_str = " and ".join(missing_keys)
     st.error(f"🚨 Error: API Key(s) not found: {keys_str}. Related features disabled.")
 
-# --- Helper Functions (extract_text_from_pdf, extract_text_from_docx - unchanged) ---
-def extract_text_from_pdf(file_bytes_io):
+# Pre-open keep-alive connections to OpenAI and Lemonfox (once per process, in the background)
+start_warm_up()
+start_exporter() # Prometheus metrics file/endpoint, if METRICS_FILE or METRICS_PORT is set
+
+# --- Helper Functions: file text extraction ---
+@st.cache_data(max_entries=64, ttl=24 * 3600, show_spinner=False)
+def _extract_document_cached(content_hash, kind, page_range, char_budget, parser_version, _file_bytes):
+    """Shared by all sessions and keyed on the upload's content hash (never its name), so a
+    handout uploaded by a whole class is parsed once. Failures raise and are not cached."""
+    return extract_document(_file_bytes, kind, char_budget=char_budget, page_range=page_range)
+
+def extract_text_from_file(file_bytes, file_name, page_range=""):
+    """Returns the text of a PDF/DOCX/TXT upload, or None (after showing an error) if it can't be used."""
+    import PyPDF2  # Only for its error class; loaded on first upload rather than at start-up
+    kind = document_kind(file_name)
     try:
-        pdf_reader = PyPDF2.PdfReader(file_bytes_io)
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text: text += page_text + "\n\n"
-        return text
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+        text, truncated, note = _extract_document_cached(
+            content_hash, kind, page_range, MAX_CHAR_LIMIT, PARSER_VERSION, file_bytes
+        )
+    except PageRangeError as e:
+        st.error(f"Invalid page selection: {e}")
+        return None
     except PyPDF2.errors.PdfReadError as e:
         st.error(f"Error reading PDF: Corrupted or encrypted? ({e})")
         return None
     except Exception as e:
-        st.error(f"PDF processing error: {e}")
+        st.error(f"Error reading {(kind or 'file').upper()}: {e}")
         return None
-
-def extract_text_from_docx(file_bytes_io):
-    try:
-        doc = docx.Document(file_bytes_io)
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return text
-    except Exception as e:
-        st.error(f"Error reading DOCX: {e}")
+    if truncated:
+        hint = f" {note} Choose a smaller page range." if kind == "pdf" else ""
+        st.error(f"File text exceeds limit ({MAX_CHAR_LIMIT} chars).{hint}")
         return None
+    if note:
+        st.info(note)
+    return text
 
 # --- Helper Function: text_to_speech ---
-def text_to_speech(text, voice_key):
-    """Converts text to speech using the Lemonfox API."""
+def _speech_job(job, text, voice_key, response_format):
+    """Background job: synthesizes `text`, exposing the audio received so far as job.partial().
+
+    Returns (audio_bytes, reused_parts, total_parts), or None if the job was cancelled.
+    """
+    # After an edit, only the changed parts are synthesized again; the rest come from the cache
+    reused, total = cached_chunk_count(text, voice_key, model=TTS_MODEL, response_format=response_format)
+    show_wait = lambda provider, seconds: job.report(message=QUEUED_MESSAGE.format(seconds=seconds) if seconds else "")
+    with report_waits(show_wait):
+        fragments = stream_long_speech(
+            text, voice_key, LEMONFOX_API_KEY, model=TTS_MODEL, response_format=response_format,
+            timeout=60, progress_callback=lambda done, total: job.report(done, total)
+        )
+        audio = bytearray()
+        for fragment in fragments:
+            if job.cancel_requested:
+                fragments.close() # Stops the remaining chunk requests
+                return None
+            audio += fragment
+            job.add_partial(fragment)
+    return bytes(audio), reused, total
+
+def text_to_speech(text, voice_key, response_format="mp3"):
+    """Starts converting text to speech with the Lemonfox API, in one of AUDIO_FORMATS.
+
+    The conversion runs as a background job (see jobs.py) so reruns neither block on nor
+    restart it; returns the job id, or None (after showing an error) if it can't start.
+    """
     if not LEMONFOX_API_KEY:
         st.error("Cannot convert: Lemonfox API Key missing.")
         return None
@@ -92,51 +147,190 @@ def text_to_speech(text, voice_key):
     if len(text) > MAX_CHAR_LIMIT:
         st.error(f"Error: Text ({len(text)} chars) exceeds limit ({MAX_CHAR_LIMIT}).")
         return None
-
-    headers = {"Authorization": f"Bearer {LEMONFOX_API_KEY}", "Content-Type": "application/json"}
-    data = {"model": TTS_MODEL, "input": text, "voice": voice_key, "response_format": "mp3"}
-
-    try:
-        with st.spinner("🔊 Generating speech (Lemonfox)..."):
-            response = requests.post(LEMONFOX_API_URL, headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-        st.success("✅ Speech generated!")
-        return response.content
-    except requests.exceptions.RequestException as e:
-        st.error(f"Lemonfox API Error: {e}")
-        return None
-    except Exception as e:
-        st.error(f"TTS conversion error: {e}")
-        return None
+    job_id = get_job_executor().submit(
+        _speech_job, text, voice_key, response_format, label="🔊 Generating speech (Lemonfox)..."
+    )
+    st.session_state.tts_job_id = job_id
+    st.session_state.tts_job_format = response_format
+    st.session_state.preview_length = 0; st.session_state.preview_started = None
+    st.session_state.conversion_complete = False; st.session_state.audio_key = None
+    return job_id
+
+def collect_speech(job):
+    """Stores a finished speech job's audio for this session, or shows why there is none."""
+    st.session_state.tts_job_id = None
+    if job is not None:
+        get_job_executor().discard(job.id) # The audio moves to the audio store; don't hold it twice
+    if job is None:
+        st.error("This conversion is no longer available. Please convert the text again.")
+    elif job.status == "cancelled":
+        st.info("Conversion cancelled.")
+    elif job.error is not None:
+        if isinstance(job.error, requests.exceptions.RequestException):
+            st.error(f"Lemonfox API Error: {job.error}")
+        else:
+            st.error(f"TTS conversion error: {job.error}")
+    else:
+        audio_data, reused, total = job.result
+        response_format = st.session_state.tts_job_format
+        st.session_state.audio_key = get_audio_store().put(audio_data, AUDIO_FORMATS[response_format][0])
+        st.session_state.audio_format = response_format
+        st.session_state.conversion_complete = True
+        # Pick up where the streaming preview (if any) had got to
+        started = st.session_state.preview_started
+        st.session_state.audio_start_time = int(time.time() - started) if started else 0
+        st.success("✅ Speech generated!" + (f" Reused {reused} of {total} parts from earlier conversions." if reused and total > 1 else ""))
 
 # --- Helper Function: perform_image_analysis ---
+def _vision_job(job, image_bytes, is_upload):
+    """Background job: encodes one image and streams its description into job.partial() (UTF-8).
+
+    Returns the description, or as much of it as was written if the job was cancelled.
+    """
+    show_wait = lambda provider, seconds: job.report(message=QUEUED_MESSAGE.format(seconds=seconds) if seconds else "")
+    with report_waits(show_wait):
+        base64_image = encode_image_from_bytes(image_bytes, detail=VISION_DETAIL)
+        parts = stream_photo_description(base64_image, upload=is_upload, detail=VISION_DETAIL)
+        description = []
+        for part in parts:
+            description.append(part)
+            job.add_partial(part.encode("utf-8"))
+            if job.cancel_requested:
+                parts.close() # Stops generating; a partial description is not cached
+                break
+    return "".join(description)
+
 def perform_image_analysis(image_bytes, is_upload):
-    """Analyzes image using OpenAI and returns the description or None on error."""
+    """Starts analyzing an image with OpenAI as a background job; returns the job id or None on error."""
     if not OPENAI_API_KEY:
          st.error("Cannot analyze: OpenAI API Key missing.")
          return None
-    try:
-        with st.spinner("🖼️ Analyzing image (OpenAI)..."):
-            base64_image = encode_image_from_bytes(image_bytes)
-            description = look_at_photo(base64_image, upload=is_upload)
+    return get_job_executor().submit(_vision_job, image_bytes, is_upload, label="🖼️ Analyzing image (OpenAI)...")
 
-        if description and "error" not in description.lower() and "fail" not in description.lower():
-            st.success("✅ Image analyzed.")
-            return description
-        else:
-            st.error(f"Image analysis failed: {description or 'No description returned.'}")
-            return None
+def _describe_page(image_bytes):
+    """One page of a multi-image upload: (description, None), or (None, error) if it failed."""
+    try:
+        return describe_photo(encode_image_from_bytes(image_bytes, detail=VISION_DETAIL), upload=True, detail=VISION_DETAIL), None
     except Exception as e:
-        st.error(f"Error during image analysis call: {e}")
+        return None, e
+
+def _vision_batch_job(job, images):
+    """Background job: describes several images concurrently and combines them in upload order.
+
+    A page is added to job.partial() (UTF-8) as soon as it and every page before it are done,
+    so the text box fills in reading order. A failed page is noted in the text; if every page
+    fails the job fails. If the job is cancelled, the pages finished in order so far are returned.
+    """
+    results = [None] * len(images)
+    pages = []
+    executor = ThreadPoolExecutor(max_workers=min(IMAGE_BATCH_WORKERS, len(images)))
+    try:
+        futures = {executor.submit(_describe_page, image): number for number, image in enumerate(images)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            job.report(done, len(images))
+            while len(pages) < len(images) and results[len(pages)] is not None:
+                description, _ = results[len(pages)]
+                number = len(pages) + 1
+                page = f"Page {number}. {description}" if description else f"Page {number} could not be described."
+                job.add_partial(("\n\n" if pages else "").encode("utf-8") + page.encode("utf-8"))
+                pages.append(page)
+            if job.cancel_requested:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True) # Pages not started yet are dropped on cancel
+    errors = [result[1] for result in results if result and result[1] is not None]
+    if len(errors) == len(images):
+        raise errors[0]
+    return "\n\n".join(pages)
+
+def perform_batch_analysis(images):
+    """Starts describing several images (in order) as one background job; returns the job id or None on error."""
+    if not OPENAI_API_KEY:
+         st.error("Cannot analyze: OpenAI API Key missing.")
+         return None
+    return get_job_executor().submit(_vision_batch_job, images, label=f"🖼️ Analyzing {len(images)} images (OpenAI)...")
+
+def collect_image_description(job):
+    """Returns a finished analysis job's description, or None (after showing an error)."""
+    if job is None:
+        st.error("This image analysis is no longer available. Please try the image again.")
+        return None
+    get_job_executor().discard(job.id)
+    if job.error is not None:
+        st.error(f"Error during image analysis call: {job.error}")
+        return None
+    description = job.result
+    if not description:
+        st.error("Image analysis failed: No description returned.")
         return None
+    if job.status == "cancelled":
+        st.info("Image description stopped early. You can edit it or convert it as it is.")
+    else:
+        st.success("✅ Image analyzed.")
+    return description
+
+@st.fragment(run_every=DESCRIPTION_POLL_SECONDS)
+def watch_description(job_id):
+    """Shows an image description as it is written, in place of the text box; reruns the app once it is done."""
+    job = get_job_executor().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.text_area(
+        "Describing image...", value=job.partial().decode("utf-8", errors="ignore"), height=250, disabled=True
+    )
+    done, total = job.progress
+    if total > 1:
+        st.progress(done / total, text=f"Described {done} of {total} images")
+    if job.message:
+        st.info(job.message)
+    if st.button("Stop describing", key="stop_description"):
+        job.cancel()
+
+# --- Helper Function: watch_job ---
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def watch_job(job_id, audio_format=None):
+    """Shows a running job's progress, refreshing on its own; reruns the whole app once it is done.
+
+    For a speech job (`audio_format` given) the audio received so far starts playing once
+    STREAM_PREVIEW_SECONDS of audio have arrived. An st.audio element cannot grow, so the preview is
+    re-rendered each time the received audio doubles, resuming where playback should be.
+    """
+    job = get_job_executor().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.write(job.label)
+    if job.message:
+        st.info(job.message)
+    done, total = job.progress
+    if total:
+        st.progress(done / total, text=f"Synthesized part {done} of {total}")
+    if audio_format is None:
+        return
+    partial = job.partial()
+    length = st.session_state.preview_length
+    if len(partial) >= max(stream_preview_bytes(audio_format), 2 * length):
+        started = st.session_state.preview_started
+        st.session_state.preview_position = int(time.time() - started) if started else 0
+        st.session_state.preview_started = started or time.time()
+        st.session_state.preview_length = length = len(partial)
+    if length:
+        # The same bytes and start time on every poll, so the player keeps going in between refreshes
+        st.audio(partial[:length], format=AUDIO_FORMATS[audio_format][0],
+                 start_time=st.session_state.preview_position, autoplay=True)
+    if st.button("Cancel", key="cancel_job"):
+        job.cancel()
 
 # --- Initialize Session State ---
 default_values = {
     "text_input": "", "uploaded_file_text": "", "uploaded_file_name": None,
-    "image_description": "", "audio_data": None, "conversion_complete": False,
+    "image_description": "", "audio_key": None, "audio_format": "mp3", "conversion_complete": False,
     "active_source_info": DEFAULT_SOURCE_INFO, "captured_image": None,
     "uploaded_image": None, "camera_key": "camera_1", "uploader_key": "uploader_1",
-    "processed_file_name": None,
+    "processed_file_key": None, "audio_start_time": 0,
+    # Background jobs (see jobs.py): only their ids live in the session, so results survive reruns
+    "tts_job_id": None, "tts_job_format": "mp3", "vision_job_id": None, "vision_job_speech": None,
+    "preview_length": 0, "preview_position": 0, "preview_started": None,
     "image_processing_mode": IMAGE_MODE_TEXT_FIRST # Default image mode
 }
 for key, value in default_values.items():
@@ -145,26 +339,74 @@ for key, value in default_values.items():
 
 # --- Main App Layout ---
 st.title("Accessible Text-to-Speech 🔊")
-col1, col2 = st.columns([3, 2])
+
+# A finished image analysis fills the text box, so it is collected before the box is drawn
+if st.session_state.vision_job_id:
+    vision_job = get_job_executor().get(st.session_state.vision_job_id)
+    if vision_job is None or vision_job.finished:
+        st.session_state.vision_job_id = None
+        description = collect_image_description(vision_job)
+        if description:
+            st.session_state.text_input = description
+            st.session_state.image_description = description
+            st.session_state.uploaded_file_text = ""
+            st.session_state.uploaded_file_name = None
+            st.session_state.active_source_info = "Using text from analyzed image"
+            st.session_state.conversion_complete = False # Reset audio initially
+            st.session_state.audio_key = None
+
+            # --- Conditional TTS Call (voice and format as selected when the image arrived) ---
+            if st.session_state.vision_job_speech:
+                st.write("Immediately generating speech for the image...") # User feedback
+                text_to_speech(description, *st.session_state.vision_job_speech)
+        st.session_state.vision_job_speech = None
+
+
+def selected_speech_settings():
+    """(voice key, audio format) currently chosen in Column 1, read from its widgets' session state."""
+    return VOICE_OPTIONS[st.session_state.voice_selector], AUDIO_FORMAT_OPTIONS[st.session_state.audio_format_selector]
+
+
+def follow_image_analysis(job_id):
+    """Remembers a submitted image analysis (and whether speech should follow it), then reruns so
+    its description streams into the text box in Column 1."""
+    st.session_state.vision_job_id = job_id
+    # Speech follows with the voice and format selected in Column 1, if that mode is on
+    immediate = st.session_state.image_processing_mode == IMAGE_MODE_IMMEDIATE_SPEECH
+    st.session_state.vision_job_speech = selected_speech_settings() if immediate else None
+    if job_id:
+        st.rerun()
+
+
+# Each region below is a fragment, so typing, picking a voice or opening an expander reruns only
+# its own region. Changes that affect another region (a new job, cleared audio) rerun the whole app.
 
 # --- Column 1: Text Input, File Upload, Controls ---
-with col1:
+@st.fragment
+def text_input_section():
     st.header("1. Provide Text")
     st.info(f"**Source:** {st.session_state.active_source_info}")
 
-    # Text input area
-    current_text_in_box = st.text_area(
-        "Type, paste, or describe image here", height=250,
-        value=st.session_state.text_input, # Display current state
-        key="text_area_main",
-        help=f"Max {MAX_CHAR_LIMIT} chars for TTS."
-    )
+    # Text input area; an image description being written streams in here instead
+    if st.session_state.vision_job_id:
+        watch_description(st.session_state.vision_job_id)
+        current_text_in_box = st.session_state.text_input
+    else:
+        current_text_in_box = st.text_area(
+            "Type, paste, or describe image here", height=250,
+            value=st.session_state.text_input, # Display current state
+            key="text_area_main",
+            help=f"Max {MAX_CHAR_LIMIT} chars for TTS."
+        )
     if current_text_in_box != st.session_state.text_input:
          st.session_state.text_input = current_text_in_box
          if current_text_in_box:
              st.session_state.active_source_info = "Using typed text"
+             had_audio = st.session_state.conversion_complete
              st.session_state.conversion_complete = False
-             st.session_state.audio_data = None
+             st.session_state.audio_key = None
+             if had_audio:
+                 st.rerun() # Removes the previous text's player from the Audio Output region
          elif not st.session_state.uploaded_file_text and not st.session_state.image_description:
              st.session_state.active_source_info = DEFAULT_SOURCE_INFO
 
@@ -174,38 +416,32 @@ with col1:
         help=f"Max text length: {MAX_CHAR_LIMIT} chars.",
         key=st.session_state.uploader_key
     )
+    pdf_page_range = ""
+    if uploaded_file is not None and uploaded_file.name.lower().endswith('.pdf'):
+        pdf_page_range = st.text_input(
+            "PDF pages to read", key="pdf_page_range", placeholder="e.g. 1-5, 8 (blank = all pages)"
+        ).strip()
 
-    # Process uploaded text file
+    # Process uploaded text file: once per upload (file_id, not name) and again if a different page range is chosen
     if uploaded_file is not None:
-        if uploaded_file.name != st.session_state.get('processed_file_name', None):
-            st.session_state.processed_file_name = uploaded_file.name
+        file_key = (uploaded_file.file_id, pdf_page_range)
+        file_marker = uploaded_file.name + (f" (pages {pdf_page_range})" if pdf_page_range else "")
+        if file_key != st.session_state.get('processed_file_key', None):
+            st.session_state.processed_file_key = file_key
             st.write(f"Processing file: `{uploaded_file.name}`")
-            file_text = None
             try:
-                # (File extraction logic remains the same)
-                bytes_data = io.BytesIO(uploaded_file.getvalue())
-                if uploaded_file.name.lower().endswith('.pdf'): file_text = extract_text_from_pdf(bytes_data)
-                elif uploaded_file.name.lower().endswith('.docx'): file_text = extract_text_from_docx(bytes_data)
-                elif uploaded_file.name.lower().endswith('.txt'):
-                    try: file_text = bytes_data.getvalue().decode("utf-8")
-                    except UnicodeDecodeError:
-                        try: file_text = bytes_data.getvalue().decode("latin-1"); st.warning("Decoded TXT as Latin-1.")
-                        except: file_text = None; st.error("Cannot decode TXT file.")
+                file_text = extract_text_from_file(uploaded_file.getvalue(), uploaded_file.name, pdf_page_range)
 
                 if file_text is not None:
-                    if len(file_text) > MAX_CHAR_LIMIT:
-                         st.error(f"File text ({len(file_text)} chars) exceeds limit ({MAX_CHAR_LIMIT}).")
-                         st.session_state.uploaded_file_text = ""; st.session_state.uploaded_file_name = None
-                    else:
-                        # SUCCESSFUL TEXT FILE -> Update state
-                        st.session_state.uploaded_file_text = file_text
-                        st.session_state.uploaded_file_name = uploaded_file.name
-                        st.session_state.text_input = file_text # Display file text in box
-                        st.session_state.image_description = ""; st.session_state.captured_image = None; st.session_state.uploaded_image = None # Clear image stuff
-                        st.session_state.active_source_info = f"Using text from: {uploaded_file.name}"
-                        st.session_state.conversion_complete = False; st.session_state.audio_data = None
-                        st.session_state.camera_key = "cam_" + str(hash(uploaded_file.name))[:4] # Reset camera
-                        st.rerun()
+                    # SUCCESSFUL TEXT FILE -> Update state
+                    st.session_state.uploaded_file_text = file_text
+                    st.session_state.uploaded_file_name = uploaded_file.name
+                    st.session_state.text_input = file_text # Display file text in box
+                    st.session_state.image_description = ""; st.session_state.captured_image = None; st.session_state.uploaded_image = None # Clear image stuff
+                    st.session_state.active_source_info = f"Using text from: {file_marker}"
+                    st.session_state.conversion_complete = False; st.session_state.audio_key = None
+                    st.session_state.camera_key = "cam_" + str(hash(uploaded_file.name))[:4] # Reset camera
+                    st.rerun()
                 else: # File text extraction failed
                     st.session_state.uploaded_file_text = ""; st.session_state.uploaded_file_name = None
                     if not st.session_state.text_input: st.session_state.active_source_info = DEFAULT_SOURCE_INFO
@@ -218,37 +454,55 @@ with col1:
     voice_selection = st.selectbox(
         "Choose Lemonfox voice", options=list(VOICE_OPTIONS.keys()), index=0, key="voice_selector"
     )
-    # Get the selected voice key HERE, so it's available for Column 2 processing
     selected_voice_key = VOICE_OPTIONS[voice_selection]
+    # Defaults to the smallest format this browser can play
+    format_selection = st.selectbox(
+        "Audio format", options=list(AUDIO_FORMAT_OPTIONS.keys()), key="audio_format_selector",
+        index=list(AUDIO_FORMAT_OPTIONS.values()).index(client_audio_format()),
+        help="Smaller files start playing sooner on slow connections."
+    )
+    selected_format = AUDIO_FORMAT_OPTIONS[format_selection]
 
     # Main Convert Button
     text_to_convert_now = st.session_state.text_input
     convert_button_disabled = not text_to_convert_now or not LEMONFOX_API_KEY
     if st.button("Convert Text Box to Speech", type="primary", key="main_convert_button", disabled=convert_button_disabled):
-        # Call TTS using the selected voice from above
-        audio_data = text_to_speech(text_to_convert_now, selected_voice_key)
-        if audio_data:
-            st.session_state.audio_data = audio_data
-            st.session_state.conversion_complete = True
-        else:
-            st.session_state.audio_data = None
-            st.session_state.conversion_complete = False
-        # Rerun might be needed IF the audio player doesn't always update automatically
-        # st.rerun()
+        # Call TTS using the selected voice from above; the Audio Output region follows the job's progress
+        if text_to_speech(text_to_convert_now, selected_voice_key, response_format=selected_format):
+            st.rerun()
 
 
-# --- Column 2: Image Input and Audio Output ---
-with col2:
+# --- Column 2: Audio Output and Image Input ---
+@st.fragment
+def audio_output_section():
     st.header("Audio Output")
-    if st.session_state.conversion_complete and st.session_state.audio_data:
-        st.audio(st.session_state.audio_data, format="audio/mp3")
-        st.download_button("Download MP3", st.session_state.audio_data, "speech.mp3", "audio/mpeg")
-    elif st.session_state.conversion_complete and not st.session_state.audio_data:
+    if st.session_state.tts_job_id:
+        tts_job = get_job_executor().get(st.session_state.tts_job_id)
+        if tts_job is None or tts_job.finished:
+            collect_speech(tts_job)
+        else:
+            watch_job(tts_job.id, st.session_state.tts_job_format)
+
+    # The session only holds a key; the audio itself lives once in the shared store
+    audio_data = get_audio_store().get(st.session_state.audio_key)
+    if st.session_state.conversion_complete and audio_data:
+        # Pick up where the streaming preview (if any) had got to
+        resume_at = st.session_state.audio_start_time
+        # The download's type and name follow the format the audio was generated in
+        mime_type, extension, _ = AUDIO_FORMATS[st.session_state.audio_format]
+        st.audio(audio_data, format=mime_type, start_time=resume_at, autoplay=resume_at > 0)
+        st.download_button(f"Download {extension.upper()}", audio_data, f"speech.{extension}", mime_type)
+    elif st.session_state.conversion_complete and st.session_state.audio_key:
+        st.error("This audio is no longer available. Please convert the text again.")
+        st.session_state.conversion_complete = False
+    elif st.session_state.conversion_complete:
         # Display error if conversion was triggered but failed
         st.error("Audio generation failed. Check input/API status.")
         st.session_state.conversion_complete = False # Reset flag
 
 
+@st.fragment
+def image_input_section():
     st.header("Alternative Input: Image")
 
     # --- Image Processing Mode Selection ---
@@ -274,79 +528,62 @@ with col2:
 
                 # --- IMMEDIATE ANALYSIS ---
                 img_bytes = captured_image_buffer.getvalue()
-                description = perform_image_analysis(img_bytes, is_upload=False)
-
-                if description:
-                    # Always update text state first
-                    st.session_state.text_input = description
-                    st.session_state.image_description = description
-                    st.session_state.uploaded_file_text = ""
-                    st.session_state.uploaded_file_name = None
-                    st.session_state.active_source_info = "Using text from analyzed image"
-                    st.session_state.conversion_complete = False # Reset audio initially
-                    st.session_state.audio_data = None
-
-                    # --- Conditional TTS Call ---
-                    if st.session_state.image_processing_mode == IMAGE_MODE_IMMEDIATE_SPEECH:
-                        st.write("Immediately generating speech for captured photo...") # User feedback
-                        # Use the voice selected in Column 1
-                        audio_data = text_to_speech(description, selected_voice_key)
-                        if audio_data:
-                            st.session_state.audio_data = audio_data
-                            st.session_state.conversion_complete = True
-                        # Errors handled within text_to_speech
-
-                    # Rerun to update text box display and potentially the audio player
-                    st.rerun()
+                follow_image_analysis(perform_image_analysis(img_bytes, is_upload=False))
 
 
     # --- Image Upload ---
     with st.expander("🖼️ Upload Image", expanded=False):
-        uploaded_image_file = st.file_uploader(
+        uploaded_image_files = st.file_uploader(
             "Upload (JPG, PNG, etc.)",
             type=["jpg", "jpeg", "png", "gif", "bmp", "webp"],
-            key=st.session_state.uploader_key + "_img"
+            key=st.session_state.uploader_key + "_img", accept_multiple_files=True,
+            help="Upload several images (e.g. every page of a worksheet) to describe them as one text, in upload order."
         )
+        images_key = tuple(image_file.file_id for image_file in uploaded_image_files)
 
-        if uploaded_image_file is not None:
-             if uploaded_image_file != st.session_state.uploaded_image:
-                st.session_state.uploaded_image = uploaded_image_file
+        if len(uploaded_image_files) == 1:
+             uploaded_image_file = uploaded_image_files[0]
+             if images_key != st.session_state.uploaded_image:
+                st.session_state.uploaded_image = images_key
                 st.session_state.captured_image = None
                 st.image(uploaded_image_file, caption="Uploaded Image", width=250)
                 st.session_state.camera_key = "camera_" + str(hash(uploaded_image_file.getvalue()))[:6] # Reset camera
 
                 # --- IMMEDIATE ANALYSIS ---
                 img_bytes = uploaded_image_file.getvalue()
-                description = perform_image_analysis(img_bytes, is_upload=True)
-
-                if description:
-                    # Always update text state first
-                    st.session_state.text_input = description
-                    st.session_state.image_description = description
-                    st.session_state.uploaded_file_text = ""
-                    st.session_state.uploaded_file_name = None
-                    st.session_state.active_source_info = "Using text from analyzed image"
-                    st.session_state.conversion_complete = False # Reset audio initially
-                    st.session_state.audio_data = None
-
-                    # --- Conditional TTS Call ---
-                    if st.session_state.image_processing_mode == IMAGE_MODE_IMMEDIATE_SPEECH:
-                        st.write("Immediately generating speech for uploaded image...") # User feedback
-                        # Use the voice selected in Column 1
-                        audio_data = text_to_speech(description, selected_voice_key)
-                        if audio_data:
-                            st.session_state.audio_data = audio_data
-                            st.session_state.conversion_complete = True
-                        # Errors handled within text_to_speech
-
-                    # Rerun to update text box display and potentially the audio player
-                    st.rerun()
+                follow_image_analysis(perform_image_analysis(img_bytes, is_upload=True))
+
+        # --- Multi-image upload: described concurrently, combined in page order, spoken once ---
+        elif len(uploaded_image_files) > 1:
+            st.image(uploaded_image_files, caption=[f"Page {number}" for number in range(1, len(images_key) + 1)], width=100)
+            if st.button(f"Describe {len(images_key)} images as one text", key="describe_images_button",
+                         disabled=images_key == st.session_state.uploaded_image):
+                st.session_state.uploaded_image = images_key
+                st.session_state.captured_image = None
+                st.session_state.camera_key = "camera_" + str(hash(images_key))[:6] # Reset camera
+                follow_image_analysis(perform_batch_analysis([image_file.getvalue() for image_file in uploaded_image_files]))
+
+
+col1, col2 = st.columns([3, 2])
+with col1:
+    text_input_section()
+with col2:
+    audio_output_section()
+    image_input_section()
 
 
 # --- Footer ---
 st.markdown("---")
 st.caption(f"Accessible TTS Tool | Max text: {MAX_CHAR_LIMIT} chars.")
 st.caption("Requires OpenAI & Lemonfox API keys in secrets.")
+stats = cache_stats()
+st.caption(
+    f"Audio cache: {stats['memory_hits'] + stats['disk_hits']} hits / {stats['misses']} misses "
+    f"({stats['hit_rate']:.0%}), ~{stats['seconds_saved']:.0f}s and {stats['chars_saved']} billed chars saved, "
+    f"{stats['memory_evictions'] + stats['disk_evictions']} evictions."
+)
+vision_stats = get_description_cache().stats()
+st.caption(f"Image description cache: {vision_stats['hits']} hits / {vision_stats['misses']} misses ({vision_stats['hit_rate']:.0%}).")
 
 # --- Debugging ---
 # with st.expander("Debug Session State"):
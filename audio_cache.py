@@ -0,0 +1,237 @@
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from metrics import log_event
+
+# --- Configuration (overridable through environment variables) ---
+CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tts_st_cache"))
+MEMORY_MAX_BYTES = int(os.environ.get("TTS_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))  # 64 MB in-process
+DISK_MAX_BYTES = int(os.environ.get("TTS_CACHE_DISK_BYTES", 1024 * 1024 * 1024))  # 1 GB shared on disk
+DISK_TTL_SECONDS = int(os.environ.get("TTS_CACHE_TTL_SECONDS", 7 * 24 * 3600))  # One week
+
+
+def normalize_text(text):
+    """Normalizes text so trivially different inputs share a cache entry."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t\f\v]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def make_cache_key(text, voice_key, model, response_format):
+    """Content address for one synthesized clip. `text` must already be normalized."""
+    h = hashlib.sha256()
+    for part in (model, voice_key, response_format, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class AudioCache:
+    """Two-tier audio cache: a byte-bounded in-process LRU in front of a shared SQLite file.
+
+    The SQLite tier is safe to share between processes (WAL mode) and enforces both a
+    TTL and a total size quota, evicting least recently used entries first.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_max_bytes=MEMORY_MAX_BYTES,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl_seconds=DISK_TTL_SECONDS):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (data, synth_seconds, chars)
+        self._memory_bytes = 0
+        self._counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+            "memory_evictions": 0, "disk_evictions": 0, "expired": 0,
+            "bytes_served": 0, "chars_saved": 0, "seconds_saved": 0.0,
+        }
+        self._db_path = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db_path = os.path.join(cache_dir, "audio_cache.sqlite3")
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS audio ("
+                    " key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL,"
+                    " chars INTEGER NOT NULL, synth_seconds REAL NOT NULL,"
+                    " created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS audio_accessed ON audio (accessed)")
+        except (OSError, sqlite3.Error) as e:
+            log_event("audio_disk_cache_disabled", level="warning", error=str(e))
+            self._db_path = None
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Yields a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self._db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Memory tier ---
+    def _memory_put(self, key, entry):
+        size = len(entry[0])
+        if size > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)[0])
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (old_data, _, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            self._counters["memory_evictions"] += 1
+
+    # --- Public API ---
+    def get(self, key):
+        """Returns cached audio bytes for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._record_hit("memory_hits", entry)
+                return entry[0]
+
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._memory_put(key, entry)
+            self._record_hit("disk_hits", entry)
+            return entry[0]
+
+    def put(self, key, data, synth_seconds=0.0, chars=0):
+        """Stores freshly synthesized audio in both tiers."""
+        if not data:
+            return
+        entry = (data, synth_seconds, chars)
+        with self._lock:
+            self._memory_put(key, entry)
+            self._counters["stores"] += 1
+        self._disk_put(key, entry)
+
+    def cached_keys(self, keys):
+        """Returns the subset of `keys` that are cached, without counting lookups or touching recency."""
+        with self._lock:
+            found = {key for key in keys if key in self._memory}
+        remaining = [key for key in keys if key not in found]
+        if remaining and self._db_path:
+            oldest = time.time() - self.ttl_seconds
+            try:
+                with self._connect() as conn:
+                    for key in remaining:
+                        if conn.execute("SELECT 1 FROM audio WHERE key = ? AND created >= ?", (key, oldest)).fetchone():
+                            found.add(key)
+            except sqlite3.Error as e:
+                log_event("audio_disk_cache_read_failed", level="warning", error=str(e))
+        return found
+
+    def stats(self):
+        """Returns a snapshot of the hit/miss/eviction counters and tier sizes."""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["memory_entries"] = len(self._memory)
+            snapshot["memory_bytes"] = self._memory_bytes
+        lookups = snapshot["memory_hits"] + snapshot["disk_hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = (snapshot["memory_hits"] + snapshot["disk_hits"]) / lookups if lookups else 0.0
+        snapshot["disk_enabled"] = self._db_path is not None
+        return snapshot
+
+    def _record_hit(self, counter, entry):
+        data, synth_seconds, chars = entry
+        self._counters[counter] += 1
+        self._counters["bytes_served"] += len(data)
+        self._counters["chars_saved"] += chars
+        self._counters["seconds_saved"] += synth_seconds
+
+    # --- Disk tier ---
+    def _disk_get(self, key):
+        if not self._db_path:
+            return None
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT data, synth_seconds, chars, created FROM audio WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                data, synth_seconds, chars, created = row
+                if now - created > self.ttl_seconds:
+                    conn.execute("DELETE FROM audio WHERE key = ?", (key,))
+                    with self._lock:
+                        self._counters["expired"] += 1
+                    return None
+                conn.execute("UPDATE audio SET accessed = ? WHERE key = ?", (now, key))
+                return (bytes(data), synth_seconds, chars)
+        except sqlite3.Error as e:
+            log_event("audio_disk_cache_read_failed", level="warning", error=str(e))
+            return None
+
+    def _disk_put(self, key, entry):
+        if not self._db_path:
+            return
+        data, synth_seconds, chars = entry
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO audio (key, data, size, chars, synth_seconds, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(data), len(data), chars, synth_seconds, now, now),
+                )
+                expired = conn.execute(
+                    "DELETE FROM audio WHERE created < ?", (now - self.ttl_seconds,)
+                ).rowcount
+                evicted = self._enforce_quota(conn)
+            with self._lock:
+                self._counters["expired"] += expired
+                self._counters["disk_evictions"] += evicted
+        except sqlite3.Error as e:
+            log_event("audio_disk_cache_write_failed", level="warning", error=str(e))
+
+    def _enforce_quota(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+        evicted = 0
+        if total <= self.disk_max_bytes:
+            return evicted
+        for key, size in conn.execute("SELECT key, size FROM audio ORDER BY accessed ASC").fetchall():
+            if total <= self.disk_max_bytes:
+                break
+            conn.execute("DELETE FROM audio WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """Process-wide AudioCache shared by every session.
+
+    A plain module-level singleton rather than st.cache_resource, so worker threads
+    without a ScriptRunContext (e.g. parallel chunk synthesis) can use it too.
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = AudioCache()
+        return _shared_cache
@@ -0,0 +1,67 @@
+import os
+import time
+
+import streamlit as st
+
+from tts_backend import AUDIO_FORMATS, stream_preview_bytes
+
+# --- Configuration (overridable through environment variables) ---
+# "auto" picks the smallest format each browser can play (see client_audio_format)
+AUDIO_FORMAT = os.environ.get("TTS_AUDIO_FORMAT", "auto")
+
+
+def smallest_playable_format(user_agent):
+    """The most compact TTS format (see tts_backend.AUDIO_FORMATS) the browser behind `user_agent` plays.
+
+    Chrome, Edge, Firefox and Android play Ogg Opus. Safari and every iOS browser (all WebKit)
+    get AAC, since WebKit's Ogg support is recent and patchy. Unknown clients get MP3.
+    """
+    user_agent = user_agent or ""
+    if "iPhone" in user_agent or "iPad" in user_agent:
+        return "aac"
+    if "Safari" in user_agent and not any(name in user_agent for name in ("Chrome", "Chromium", "Android")):
+        return "aac"
+    if any(name in user_agent for name in ("Chrome", "Chromium", "Firefox", "Android")):
+        return "opus"
+    return "mp3"
+
+
+def client_audio_format():
+    """TTS_AUDIO_FORMAT, or with "auto" the smallest format this session's browser can play."""
+    if AUDIO_FORMAT in AUDIO_FORMATS:
+        return AUDIO_FORMAT
+    return smallest_playable_format(st.context.headers.get("User-Agent"))
+
+
+def play_while_streaming(fragments, slot, response_format="mp3"):
+    """Collects streamed audio (one of AUDIO_FORMATS) while playing whatever has arrived so far in `slot`
+    (an st.empty(), or None).
+
+    Playback starts once STREAM_PREVIEW_SECONDS of audio have arrived (see
+    tts_backend.stream_preview_bytes). An st.audio element cannot grow, so the preview is
+    re-rendered each time the received audio doubles, resuming at the position playback
+    should have reached.
+    Returns (audio_bytes, resume_seconds), where resume_seconds is where a player showing
+    the complete file should start to carry on from the preview (0 if no preview was shown).
+    A partial preview is removed again if the stream fails.
+    """
+    audio = bytearray()
+    started = None
+    audio_format = AUDIO_FORMATS[response_format][0]
+    next_refresh = stream_preview_bytes(response_format)
+    try:
+        for fragment in fragments:
+            # Refresh only once more audio has arrived, so a preview is never the complete file: a
+            # final player with the same data and start time in the same run would be a duplicate element
+            if slot is not None and len(audio) >= next_refresh:
+                position = int(time.monotonic() - started) if started else 0
+                slot.audio(bytes(audio), format=audio_format, start_time=position, autoplay=True)
+                started = started or time.monotonic()
+                next_refresh = len(audio) * 2
+            audio += fragment
+    except Exception:
+        if slot is not None:
+            slot.empty()
+        raise
+    resume_seconds = int(time.monotonic() - started) if started else 0
+    return bytes(audio), resume_seconds
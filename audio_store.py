@@ -0,0 +1,83 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# --- Configuration (overridable through environment variables) ---
+STORE_MAX_BYTES = int(os.environ.get("AUDIO_STORE_MAX_BYTES", 256 * 1024 * 1024))  # Shared by all sessions
+
+
+class AudioStore:
+    """Process-wide store of generated audio, keyed by the SHA-256 of its content.
+
+    Sessions keep only the key in st.session_state, so a clip shared by a whole class is held
+    once rather than once per session. Least recently used clips are dropped beyond max_bytes;
+    get() then returns None and the app asks for the audio to be generated again.
+    """
+
+    def __init__(self, max_bytes=STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (data, mimetype)
+        self._bytes = 0
+
+    def put(self, data, mimetype="audio/mpeg"):
+        """Stores `data` (if not already stored) and returns its key."""
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (data, mimetype)
+                self._bytes += len(data)
+            self._entries.move_to_end(key)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return key
+
+    def get(self, key):
+        """Returns the stored bytes, or None if the key is unknown or was evicted."""
+        entry = self._get_entry(key)
+        return entry[0] if entry else None
+
+    def url(self, key):
+        """Same-origin URL serving the clip, or None if it is no longer stored.
+
+        The clip is registered with Streamlit's media endpoint, which answers HTTP range
+        requests, so players fetch and seek within it instead of receiving it inline.
+        Like st.audio, this must be called on every rerun that shows the player.
+        """
+        entry = self._get_entry(key)
+        if entry is None:
+            return None
+        data, mimetype = entry
+        import streamlit as st
+        from streamlit import runtime
+
+        if not runtime.exists():  # Bare `python app.py`: no server to serve from
+            return f"data:{mimetype};base64,{base64.b64encode(data).decode('ascii')}"
+        url = runtime.get_instance().media_file_mgr.add(data, mimetype, f"audio_store.{key}")
+        base_path = st.get_option("server.baseUrlPath").strip("/")
+        return f"/{base_path}{url}" if base_path else url
+
+    def _get_entry(self, key):
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_audio_store():
+    """Process-wide AudioStore shared by every session (see audio_cache.get_audio_cache)."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = AudioStore()
+        return _shared_store
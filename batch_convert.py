@@ -0,0 +1,207 @@
+"""Headless batch conversion of a folder of PDF/DOCX/TXT documents to MP3 (or AAC/Opus with --format).
+
+    python batch_convert.py lessons/ --output-dir lessons_audio --voice bella --jobs 2
+
+Progress is recorded in <output-dir>/manifest.json (input hash, status, output file and audio
+hash for every document). Running the same command again resumes: documents already converted
+with the same content, voice and model are skipped, and failed ones are retried. Chunks that
+were synthesized before an interruption come from the shared audio cache, so they are not paid for twice.
+
+The Lemonfox key is read from LEMONFOX_API_KEY, or from .streamlit/secrets.toml like the apps.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+import toml  # Installed with Streamlit, which reads secrets.toml the same way
+
+from document_backend import PageRangeError, document_kind, extract_document
+from tts_backend import AUDIO_FORMATS, TTS_MAX_WORKERS, TTS_MODEL, synthesize_long_speech
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+MAX_CHAR_LIMIT = 200000  # Same limit as app.py
+DEFAULT_VOICE = "bella"
+DEFAULT_JOBS = 2  # Documents converted at once; each sends up to --chunk-workers requests in parallel
+
+
+class BatchManifest:
+    """manifest.json in the output folder, rewritten atomically after every document."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("files", {})
+
+    def get(self, name):
+        with self._lock:
+            return self.entries.get(name)
+
+    def update(self, name, **fields):
+        with self._lock:
+            entry = self.entries.setdefault(name, {})
+            entry.update(fields, updated=datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"))
+            self._save()
+
+    def _save(self):
+        # Written to a temporary file first, so an interruption never leaves a half-written manifest
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def find_documents(input_dir, recursive=False):
+    """Supported documents under input_dir as paths relative to it, sorted."""
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if document_kind(file_name):
+                found.append(os.path.relpath(os.path.join(root, file_name), input_dir))
+        if not recursive:
+            break
+    return found
+
+
+def output_name(relative_path, audio_format="mp3"):
+    return os.path.splitext(relative_path)[0] + "." + AUDIO_FORMATS[audio_format][1]
+
+
+def is_done(entry, input_hash, voice_key, model, audio_format, output_dir):
+    return (
+        entry is not None and entry.get("status") == "done" and entry.get("input_sha256") == input_hash
+        and entry.get("voice") == voice_key and entry.get("model") == model
+        and entry.get("format", "mp3") == audio_format  # Manifests from before --format held MP3s
+        and os.path.exists(os.path.join(output_dir, entry["output"]))
+    )
+
+
+def convert_document(input_dir, relative_path, output_dir, manifest, voice_key, api_key, model=TTS_MODEL,
+                     max_chars=MAX_CHAR_LIMIT, chunk_workers=TTS_MAX_WORKERS, audio_format="mp3"):
+    """Converts one document, records the outcome in the manifest and returns its status."""
+    source = os.path.join(input_dir, relative_path)
+    input_hash = sha256_file(source)
+    if is_done(manifest.get(relative_path), input_hash, voice_key, model, audio_format, output_dir):
+        return "skipped"
+
+    manifest.update(relative_path, status="running", input_sha256=input_hash, voice=voice_key, model=model,
+                    format=audio_format, error=None)
+    try:
+        with open(source, "rb") as f:
+            file_bytes = f.read()
+        text, truncated, note = extract_document(file_bytes, document_kind(relative_path), char_budget=max_chars)
+        if truncated:
+            raise ValueError(f"text exceeds {max_chars} chars" + (f" ({note})" if note else ""))
+        if not text.strip():
+            raise ValueError("no text found")
+        audio = synthesize_long_speech(text, voice_key, api_key, model=model, response_format=audio_format,
+                                       max_workers=chunk_workers)
+
+        target = os.path.join(output_dir, output_name(relative_path, audio_format))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + ".part", "wb") as f:
+            f.write(audio)
+        os.replace(target + ".part", target)  # A crash mid-write never leaves a truncated file behind
+    except (requests.exceptions.RequestException, PageRangeError, ValueError, OSError) as e:
+        manifest.update(relative_path, status="failed", error=str(e))
+        return "failed"
+    except Exception as e:  # Unreadable PDF/DOCX (PyPDF2, zipfile and XML errors)
+        manifest.update(relative_path, status="failed", error=f"{type(e).__name__}: {e}")
+        return "failed"
+    manifest.update(
+        relative_path, status="done", output=output_name(relative_path, audio_format), chars=len(text),
+        audio_bytes=len(audio), audio_sha256=hashlib.sha256(audio).hexdigest(),
+    )
+    return "done"
+
+
+def convert_folder(input_dir, output_dir, voice_key, api_key, model=TTS_MODEL, jobs=DEFAULT_JOBS,
+                   chunk_workers=TTS_MAX_WORKERS, max_chars=MAX_CHAR_LIMIT, recursive=False, audio_format="mp3"):
+    """Converts every supported document in input_dir, resuming from output_dir's manifest.
+
+    Returns a dict counting documents per status ("done", "skipped", "failed").
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = BatchManifest(os.path.join(output_dir, MANIFEST_NAME))
+    documents = find_documents(input_dir, recursive=recursive)
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+    try:
+        futures = {
+            executor.submit(convert_document, input_dir, path, output_dir, manifest, voice_key, api_key,
+                            model, max_chars, chunk_workers, audio_format): path
+            for path in documents
+        }
+        for number, future in enumerate(as_completed(futures), start=1):
+            path, status = futures[future], future.result()
+            counts[status] += 1
+            error = manifest.get(path).get("error") if status == "failed" else None
+            print(f"[{number}/{len(documents)}] {status:<7} {path}" + (f": {error}" if error else ""))
+    finally:
+        # On Ctrl-C, documents not yet started are dropped; running ones finish and are recorded
+        executor.shutdown(wait=True, cancel_futures=True)
+    return counts
+
+
+def load_api_key():
+    api_key = os.environ.get("LEMONFOX_API_KEY")
+    if api_key:
+        return api_key
+    secrets_path = os.path.join(".streamlit", "secrets.toml")
+    if os.path.exists(secrets_path):
+        return toml.load(secrets_path).get("LEMONFOX_API_KEY")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a folder of PDF, DOCX and TXT files to MP3.")
+    parser.add_argument("input_dir")
+    parser.add_argument("--output-dir", help="Where the audio files and manifest.json go (default: <input_dir>/audio)")
+    parser.add_argument("--voice", default=DEFAULT_VOICE, help="Lemonfox voice, e.g. bella, michael, nova")
+    parser.add_argument("--model", default=TTS_MODEL)
+    parser.add_argument("--format", default="mp3", choices=list(AUDIO_FORMATS), help="Audio format of the output files")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Documents converted at once")
+    parser.add_argument("--chunk-workers", type=int, default=TTS_MAX_WORKERS, help="Parallel requests per document")
+    parser.add_argument("--max-chars", type=int, default=MAX_CHAR_LIMIT)
+    parser.add_argument("--recursive", action="store_true", help="Include documents in subfolders")
+    args = parser.parse_args(argv)
+
+    api_key = load_api_key()
+    if not api_key:
+        print("LEMONFOX_API_KEY not found in the environment or .streamlit/secrets.toml", file=sys.stderr)
+        return 2
+    output_dir = args.output_dir or os.path.join(args.input_dir, "audio")
+    try:
+        counts = convert_folder(args.input_dir, output_dir, args.voice, api_key, model=args.model, jobs=args.jobs,
+                                chunk_workers=args.chunk_workers, max_chars=args.max_chars, recursive=args.recursive,
+                                audio_format=args.format)
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+        return 130
+    print(f"{counts['done']} converted, {counts['skipped']} already done, {counts['failed']} failed "
+          f"(see {os.path.join(output_dir, MANIFEST_NAME)})")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""DOCX extraction benchmark: the streaming extractor in document_backend against python-docx.
+
+Builds a large DOCX with python-docx (body paragraphs, a table every few pages, a header and a
+footer) and extracts it both ways, reporting median time, peak traced memory and how many
+characters each one finds. python-docx's doc.paragraphs (the previous implementation) skips
+tables, headers and text boxes, so it also reports fewer characters.
+
+    python benchmarks/docx_benchmark.py --paragraphs 20000 --runs 5
+    python benchmarks/docx_benchmark.py --budget 200000   # also time the early cut-off
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from document_backend import extract_docx_text  # noqa: E402
+from run_benchmarks import SAMPLE_PARAGRAPH  # noqa: E402
+
+
+def make_docx(paragraphs, table_every=50, table_rows=10):
+    """A DOCX with `paragraphs` body paragraphs and a table_rows x 3 table after every `table_every`."""
+    import docx
+
+    document = docx.Document()
+    section = document.sections[0]
+    section.header.paragraphs[0].text = "Unit 3: The water cycle"
+    section.footer.paragraphs[0].text = "Science handout"
+    for number in range(paragraphs):
+        document.add_paragraph(f"{number}. {SAMPLE_PARAGRAPH}")
+        if table_every and (number + 1) % table_every == 0:
+            table = document.add_table(rows=table_rows, cols=3)
+            for row_number, row in enumerate(table.rows):
+                for column, cell in enumerate(row.cells):
+                    cell.text = f"Row {row_number} stage {column}: evaporation, condensation, precipitation"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def extract_with_python_docx(file_bytes):
+    """The previous implementation: the full object model, body paragraphs only."""
+    import docx
+
+    return "\n".join(paragraph.text for paragraph in docx.Document(io.BytesIO(file_bytes)).paragraphs)
+
+
+def measure(extract, file_bytes, runs):
+    """Median seconds over `runs`, peak traced memory of one extra run, and the characters extracted."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        text = extract(file_bytes)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    extract(file_bytes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(timings) * 1000, "peak_mb": peak / 1e6, "chars": len(text)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--paragraphs", type=int, default=10000, help="Body paragraphs in the generated DOCX")
+    parser.add_argument("--table-every", type=int, default=50, help="Insert a table after this many paragraphs (0 = none)")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per extractor")
+    parser.add_argument("--budget", type=int, help="Also time the streaming extractor with this char_budget")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    file_bytes = make_docx(args.paragraphs, table_every=args.table_every)
+    print(f"DOCX: {len(file_bytes) / 1e6:.1f} MB, {args.paragraphs} paragraphs")
+    results = {
+        "python-docx": measure(extract_with_python_docx, file_bytes, args.runs),
+        "streaming": measure(lambda data: extract_docx_text(data)[0], file_bytes, args.runs),
+    }
+    if args.budget:
+        results[f"streaming, budget {args.budget}"] = measure(
+            lambda data: extract_docx_text(data, char_budget=args.budget)[0], file_bytes, args.runs
+        )
+
+    print(f"   {'extractor':<30}{'median ms':>10}{'peak MB':>10}{'chars':>12}")
+    for name, result in results.items():
+        print(f"   {name:<30}{result['median_ms']:>10.0f}{result['peak_mb']:>10.1f}{result['chars']:>12}")
+    baseline, streaming = results["python-docx"], results["streaming"]
+    print(f"Streaming is {baseline['median_ms'] / streaming['median_ms']:.1f}x faster, uses "
+          f"{baseline['peak_mb'] / max(streaming['peak_mb'], 1e-6):.1f}x less memory and finds "
+          f"{streaming['chars'] - baseline['chars']} more characters (tables, header, footer).")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"file_bytes": len(file_bytes), "paragraphs": args.paragraphs, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+"""Offline end-to-end latency benchmark for the document flow (app.py) and the camera flows
+(simple_app.py, simple_2.py).
+
+The apps are driven headlessly with Streamlit's AppTest against local stub servers
+(see stub_servers.py), so no API keys or network are needed. Each backend stage is timed
+and reported as p50/p95/p99, along with throughput and peak traced memory per run.
+
+    python benchmarks/run_benchmarks.py --runs 20 --latency-ms 300 --error-rate 0.05
+    python benchmarks/run_benchmarks.py --json results.json
+    python benchmarks/run_benchmarks.py --compare baseline.json  # exit 1 on a p95 regression
+"""
+import argparse
+import functools
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from stub_servers import StubConfig, StubServer  # noqa: E402
+
+FLOWS = ("app", "simple_app", "simple_2")
+SAMPLE_PARAGRAPH = (
+    "The water cycle describes how water moves between the oceans, the air and the land. "
+    "Heat from the sun evaporates water from seas and lakes, and the vapour rises and cools. "
+    "As it cools it condenses into tiny droplets that form clouds. "
+    "When the droplets join together and grow heavy, they fall back to the ground as rain, snow or hail. "
+)
+
+
+# --- Stage timing ---
+class StageRecorder:
+    """Collects (stage, seconds) samples for the run in progress."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.append((stage, seconds))
+
+    def take(self):
+        with self._lock:
+            samples, self.samples = self.samples, []
+        return samples
+
+
+def _timed(recorder, stage, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            recorder.add(stage, time.perf_counter() - start)
+    return wrapper
+
+
+def _timed_stream(recorder, stage, func):
+    """Times a generator function: `<stage>_first` to its first item and `<stage>` to exhaustion."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        first = True
+        try:
+            for item in func(*args, **kwargs):
+                if first:
+                    recorder.add(f"{stage}_first", time.perf_counter() - start)
+                    first = False
+                yield item
+        finally:
+            recorder.add(stage, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_backends(recorder):
+    """Wraps the backend entry points the apps call. The apps re-import them on every script
+    run, so patching the module attributes is enough."""
+    import document_backend
+    import image_backend
+    import tts_backend
+
+    document_backend.extract_document = _timed(recorder, "extract", document_backend.extract_document)
+    image_backend.encode_image_from_bytes = _timed(recorder, "encode", image_backend.encode_image_from_bytes)
+    image_backend.look_at_photo = _timed(recorder, "vision", image_backend.look_at_photo)
+    image_backend.stream_photo_description = _timed_stream(recorder, "vision", image_backend.stream_photo_description)
+    tts_backend.stream_long_speech = _timed_stream(recorder, "tts", tts_backend.stream_long_speech)
+    tts_backend.pipeline_speech = _timed_stream(recorder, "tts", tts_backend.pipeline_speech)
+
+
+# --- Inputs ---
+def make_pdf(pages):
+    """Minimal uncompressed PDF with one Helvetica text block per page (`pages` is a list of line lists)."""
+    objects = []
+
+    def add(obj):
+        objects.append(obj)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)
+    kids = []
+    for lines in pages:
+        stream = b"BT /F1 10 Tf 40 780 Td 12 TL " + b" ".join(b"(" + line.encode("latin-1") + b") '" for line in lines) + b" ET"
+        contents = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, contents, font)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    output, offsets = b"%PDF-1.4\n", []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1) + b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return output
+
+
+def make_document(run, doc_chars):
+    """A PDF of roughly `doc_chars` characters whose text is unique to this run (so caches miss)."""
+    words = (f"Lesson {run}. " + SAMPLE_PARAGRAPH * (doc_chars // len(SAMPLE_PARAGRAPH) + 1))[:doc_chars].split(" ")
+    lines, line = [], ""
+    for word in words:
+        if len(line) + len(word) > 90:
+            lines.append(line)
+            line = ""
+        line += word + " "
+    lines.append(line)
+    return make_pdf([lines[i:i + 60] for i in range(0, len(lines), 60)])
+
+
+def make_photo(seed, size=(1600, 1200)):
+    """A phone-sized JPEG whose perceptual hash differs from seed to seed."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + rng.randrange(50, 500), y + rng.randrange(50, 400)),
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+# --- Flows ---
+def _app_test(script):
+    from streamlit import logger as streamlit_logger
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, script), default_timeout=120)
+    streamlit_logger.set_log_level("error")  # "missing ScriptRunContext" warnings would drown the report
+    at.secrets["OPENAI_API_KEY"] = "stub-key"
+    at.secrets["LEMONFOX_API_KEY"] = "stub-key"
+    return at
+
+
+def run_document_flow(run, args):
+    """app.py: extract a PDF, put its text in the text box and press Convert.
+
+    AppTest cannot drive st.file_uploader, so extraction is called directly with the
+    same function and budget app.py uses."""
+    import document_backend
+    from jobs import get_job_executor
+
+    text, _, _ = document_backend.extract_document(make_document(run, args.doc_chars), "pdf", char_budget=200000)
+    at = _app_test("app.py")
+    at.run()
+    at.text_area(key="text_area_main").input(text)
+    at.run()
+    at.button(key="main_convert_button").click()
+    at.run()
+    # The conversion runs as a background job; rerun once it is done, as the polling fragment would
+    job = get_job_executor().get(at.session_state.tts_job_id)
+    if job is not None:
+        job.wait(120)
+        at.run()
+    ok = not at.exception and bool(at.session_state.audio_key)
+    return ok, len(text)
+
+
+def run_camera_flow(script, run, args):
+    """simple_app.py / simple_2.py: a photo goes straight into the processing state."""
+    at = _app_test(script)
+    at.run()
+    photo = make_photo(script if args.warm else f"{script}-{run}")  # Per-flow photos, so one flow never warms another's cache
+    if script == "simple_app.py":
+        at.session_state.photo_buffer = photo
+        at.session_state.processing = True
+    else:
+        at.session_state.image_bytes_to_process = photo
+        at.session_state.app_state = "processing"
+    at.run()
+    ok = not at.exception and bool(at.session_state.audio_key) and not at.session_state.error_message
+    return ok, 0
+
+
+def run_flow(flow, run, args):
+    if flow == "app":
+        return run_document_flow(0 if args.warm else run, args)
+    return run_camera_flow(f"{flow}.py", run, args)
+
+
+# --- Statistics ---
+def percentile(values, fraction):
+    """Linear-interpolated percentile of a non-empty list."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(samples):
+    return {
+        "n": len(samples),
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "mean": sum(samples) / len(samples),
+    }
+
+
+def benchmark_flow(flow, args, recorder):
+    stages, peaks = {}, []
+    ok_runs, chars = 0, 0
+    started = time.perf_counter()
+    for run in range(args.warmup + args.runs):
+        recorder.take()
+        tracemalloc.reset_peak()
+        run_start = time.perf_counter()
+        ok, run_chars = run_flow(flow, run, args)
+        total = time.perf_counter() - run_start
+        peak = tracemalloc.get_traced_memory()[1]
+        samples = recorder.take()
+        if run < args.warmup:
+            started = time.perf_counter()
+            continue
+        ok_runs += ok
+        chars += run_chars
+        peaks.append(peak)
+        for stage, seconds in samples + [("total", total)]:
+            stages.setdefault(stage, []).append(seconds)
+    wall = time.perf_counter() - started
+    return {
+        "runs": args.runs,
+        "ok": ok_runs,
+        "failed": args.runs - ok_runs,
+        "throughput_runs_per_s": args.runs / wall,
+        "throughput_chars_per_s": chars / wall if chars else None,
+        "peak_memory_mb": {"p50": percentile(peaks, 0.5) / 2**20, "max": max(peaks) / 2**20},
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())},
+    }
+
+
+def print_report(results):
+    for flow, result in results["flows"].items():
+        print(f"\n== {flow}: {result['ok']}/{result['runs']} ok, {result['throughput_runs_per_s']:.2f} runs/s"
+              + (f", {result['throughput_chars_per_s']:.0f} chars/s" if result["throughput_chars_per_s"] else "")
+              + f", peak memory {result['peak_memory_mb']['p50']:.1f} MB (max {result['peak_memory_mb']['max']:.1f} MB)")
+        print(f"   {'stage':<14}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, stats in result["stages"].items():
+            print(f"   {stage:<14}{stats['n']:>5}{stats['p50'] * 1000:>10.0f}{stats['p95'] * 1000:>10.0f}{stats['p99'] * 1000:>10.0f}")
+    print(f"\nStub requests: {results['stub_requests']}")
+
+
+def compare(results, baseline, max_regression):
+    """Returns a list of "flow/stage" p95 latencies that grew by more than `max_regression`."""
+    regressions = []
+    for flow, result in results["flows"].items():
+        for stage, stats in result["stages"].items():
+            old = baseline.get("flows", {}).get(flow, {}).get("stages", {}).get(stage)
+            if old and stats["p95"] > old["p95"] * (1 + max_regression):
+                regressions.append(f"{flow}/{stage}: p95 {old['p95'] * 1000:.0f} ms -> {stats['p95'] * 1000:.0f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, default=list(FLOWS))
+    parser.add_argument("--runs", type=int, default=10, help="Measured runs per flow")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per flow before measuring")
+    parser.add_argument("--warm", action="store_true", help="Reuse the same inputs every run, so caches are hit")
+    parser.add_argument("--doc-chars", type=int, default=6000, help="Text length of the app.py document")
+    parser.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=StubConfig.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--audio-kbps", type=float, default=StubConfig.audio_kbps, help="Stub audio download speed (0 = unlimited)")
+    parser.add_argument("--tokens-per-second", type=float, default=StubConfig.tokens_per_second)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Baseline results file; exit 1 if any p95 regresses")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed p95 growth for --compare")
+    args = parser.parse_args(argv)
+
+    stub = StubServer(StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        audio_kbps=args.audio_kbps, tokens_per_second=args.tokens_per_second,
+    )).start()
+    # Must be set before the backends are imported: they read these at import time
+    os.environ["LEMONFOX_API_URL"] = stub.speech_url
+    os.environ["OPENAI_CHAT_URL"] = stub.chat_url
+    os.environ["HTTP_WARM_UP"] = "0"
+    os.environ.setdefault("METRICS_JSON_LOG", "0")  # The per-stage JSON lines would drown the report
+    os.environ["TTS_CACHE_DIR"] = tempfile.mkdtemp(prefix="tts-bench-cache-")
+
+    recorder = StageRecorder()
+    instrument_backends(recorder)
+    tracemalloc.start()
+    results = {"config": vars(args), "flows": {}}
+    try:
+        for flow in args.flows:
+            results["flows"][flow] = benchmark_flow(flow, args, recorder)
+    finally:
+        tracemalloc.stop()
+        stub.stop()
+    outcomes = {}
+    for path, outcome, _ in stub.requests:
+        outcomes[f"{path} {outcome}"] = outcomes.get(f"{path} {outcome}", 0) + 1
+    results["stub_requests"] = outcomes
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
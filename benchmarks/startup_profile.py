@@ -0,0 +1,128 @@
+"""Cold-start import profile of the app entry points.
+
+Collects each entry point's module-level imports and times them in a fresh interpreter with
+`python -X importtime`, so the figures are what a Streamlit Cloud cold start pays before the
+first widget appears. Reports the cost of each direct import and the heaviest modules behind them.
+
+    python benchmarks/startup_profile.py                    # app.py, simple_app.py and simple_2.py
+    python benchmarks/startup_profile.py simple_app.py --top 15
+    python benchmarks/startup_profile.py --budget-ms 1500   # exit 1 if an entry point imports slower
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ("app.py", "simple_app.py", "simple_2.py")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def entry_point_imports(script_path):
+    """Top-level module names imported at module level by a script, in import order.
+
+    Imports inside functions are skipped (they are not paid at start-up); imports inside
+    module-level try/if blocks are included.
+    """
+    with open(script_path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script_path)
+    modules = []
+
+    def visit(statements):
+        for node in statements:
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            else:
+                for field in ("body", "orelse", "finalbody"):
+                    visit(getattr(node, field, []))
+                for handler in getattr(node, "handlers", []):
+                    visit(handler.body)
+                continue
+            for name in names:
+                top = name.split(".")[0]
+                if top not in modules:
+                    modules.append(top)
+
+    visit(tree.body)
+    return modules
+
+
+def profile_imports(modules):
+    """Imports `modules` in order in a fresh interpreter and returns -X importtime entries as
+    (name, self_us, cumulative_us, depth), in the order the interpreter reports them."""
+    # Missing optional packages should not abort the profile of everything else
+    code = "\n".join(f"try:\n    import {module}\nexcept ImportError:\n    pass" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(1)), int(match.group(2)), (len(match.group(3)) - 1) // 2))
+    return entries
+
+
+def startup_report(script, top=10):
+    """Import cost of one entry point: total, per direct import, and the heaviest modules overall."""
+    modules = entry_point_imports(os.path.join(REPO_ROOT, script))
+    entries = profile_imports(modules)
+    direct, heaviest, pending = {}, [], []
+    # -X importtime lists children before their parent, so each depth-0 entry closes a group
+    for name, self_us, cumulative_us, depth in entries:
+        pending.append((name, self_us))
+        if depth == 0:
+            if name in modules:
+                direct[name] = cumulative_us / 1000
+                heaviest.extend((child, child_us / 1000, name) for child, child_us in pending)
+            pending = []
+    heaviest.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "script": script,
+        "total_ms": sum(direct.values()),
+        "direct_imports_ms": dict(sorted(direct.items(), key=lambda item: item[1], reverse=True)),
+        "heaviest_modules": [{"module": m, "self_ms": ms, "via": via} for m, ms, via in heaviest[:top]],
+    }
+
+
+def print_report(report):
+    print(f"\n== {report['script']}: {report['total_ms']:.0f} ms of imports")
+    for module, ms in report["direct_imports_ms"].items():
+        print(f"   {module:<34}{ms:>8.1f} ms")
+    print("   heaviest modules (self time):")
+    for item in report["heaviest_modules"]:
+        print(f"     {item['module']:<42}{item['self_ms']:>8.1f} ms  via {item['via']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scripts", nargs="*", default=list(ENTRY_POINTS), help="Entry points, relative to the repo root")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest modules to list per entry point")
+    parser.add_argument("--json", help="Write the reports to this file")
+    parser.add_argument("--budget-ms", type=float, help="Exit 1 if any entry point's imports take longer")
+    args = parser.parse_args(argv)
+
+    reports = [startup_report(script, top=args.top) for script in args.scripts]
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    if args.budget_ms is not None:
+        over = [r for r in reports if r["total_ms"] > args.budget_ms]
+        for report in over:
+            print(f"OVER BUDGET {report['script']}: {report['total_ms']:.0f} ms > {args.budget_ms:.0f} ms")
+        return 1 if over else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
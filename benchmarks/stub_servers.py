@@ -0,0 +1,151 @@
+"""Local stand-ins for the Lemonfox speech and OpenAI chat endpoints, for offline benchmarks.
+
+Both endpoints are served by one ThreadingHTTPServer on 127.0.0.1. Latency, payload size,
+streaming speed and error rate are set through StubConfig.
+"""
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One MPEG-1 Layer III frame at 128 kbps / 44.1 kHz: 4-byte header + 413 bytes of silence (26 ms of audio)
+MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+MP3_BYTES_PER_SECOND = 16000
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 300.0  # Time before the first response byte
+    jitter_ms: float = 100.0  # Uniform +/- jitter added to latency_ms
+    error_rate: float = 0.0  # Fraction of requests answered with 503 + Retry-After
+    chars_per_second: float = 15.0  # Speaking rate used to size the audio (~16 kB of MP3 per spoken second)
+    audio_kbps: float = 16000.0  # Download speed of the audio body; 0 = unlimited
+    tokens_per_second: float = 80.0  # Streaming speed of chat completions
+    description: str = (
+        "A printed worksheet titled Photosynthesis lies on a wooden desk. "
+        "The top half shows a labelled diagram of a leaf with arrows for sunlight, water and carbon dioxide. "
+        "Below it are five numbered questions with blank lines for answers. "
+        "A yellow pencil rests along the right edge of the page."
+    )
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        # Connection warm-up probes
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        stub = self.server.stub
+        config = stub.config
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+
+        if random.random() < config.error_rate:
+            stub.record(self.path, "error", 0)
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.endswith("/audio/speech"):
+            self._send_audio(stub, body.get("input", ""))
+        elif self.path.endswith("/chat/completions"):
+            self._send_completion(stub, bool(body.get("stream")))
+        else:
+            self.send_error(404)
+
+    def _send_audio(self, stub, text):
+        seconds = max(0.5, len(text) / stub.config.chars_per_second)
+        audio = MP3_FRAME * max(1, int(seconds * MP3_BYTES_PER_SECOND / len(MP3_FRAME)))
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        block = 16 * 1024
+        delay = block * 8 / (stub.config.audio_kbps * 1000) if stub.config.audio_kbps else 0
+        for start in range(0, len(audio), block):
+            self.wfile.write(audio[start:start + block])
+            if delay:
+                time.sleep(delay)
+        stub.record(self.path, "ok", len(audio))
+
+    def _send_completion(self, stub, stream):
+        # Numbered so each photo gets a different description, as real photos would (and TTS caches miss)
+        description = f"Photo {stub.next_number()}. {stub.config.description}"
+        if not stream:
+            data = json.dumps({"choices": [{"message": {"role": "assistant", "content": description}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            stub.record(self.path, "ok", len(data))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")  # No Content-Length: the body ends when the connection closes
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        for token in description.split(" "):
+            event = {"choices": [{"delta": {"content": token + " "}}]}
+            line = f"data: {json.dumps(event)}\n\n".encode()
+            self.wfile.write(line)
+            self.wfile.flush()
+            sent += len(line)
+            time.sleep(1 / stub.config.tokens_per_second)
+        self.wfile.write(b"data: [DONE]\n\n")
+        stub.record(self.path, "ok", sent)
+
+
+class StubServer:
+    """Serves /v1/audio/speech and /v1/chat/completions on a free local port until stop() is called."""
+
+    def __init__(self, config=None):
+        self.config = config or StubConfig()
+        self._lock = threading.Lock()
+        self.requests = []  # (path, outcome, body_bytes)
+        self._counter = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def speech_url(self):
+        return f"{self.base_url}/v1/audio/speech"
+
+    @property
+    def chat_url(self):
+        return f"{self.base_url}/v1/chat/completions"
+
+    def next_number(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def record(self, path, outcome, body_bytes):
+        with self._lock:
+            self.requests.append((path, outcome, body_bytes))
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,103 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, UnidentifiedImageError
+
+# --- Configuration (overridable through environment variables) ---
+HASH_SIZE = 16  # 16x16 difference hash = 256 bits
+# Hamming distance (out of 256 bits) still counted as "same image". Re-encoded, resized or
+# re-uploaded copies land within ~4 bits, while different worksheets with a similar layout
+# start around 10, so keep this conservative: a wrong description is worse than a miss.
+MAX_DISTANCE = int(os.environ.get("VISION_CACHE_MAX_DISTANCE", 6))
+MAX_ENTRIES = int(os.environ.get("VISION_CACHE_MAX_ENTRIES", 2048))
+TTL_SECONDS = int(os.environ.get("VISION_CACHE_TTL_SECONDS", 24 * 3600))
+
+
+def perceptual_hash(image_bytes, hash_size=HASH_SIZE):
+    """Difference hash of an image as an int, or None if the image cannot be decoded.
+
+    Robust to re-encoding, resizing and small exposure changes, so repeated uploads or
+    near-identical captures of the same image hash to nearby values.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    pixels = image.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+class DescriptionCache:
+    """In-process cache of image descriptions, matched by perceptual-hash Hamming distance.
+
+    Entries are bucketed by (model, prompt_version, detail) so a different model or a
+    changed prompt never returns a stale description.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (bucket, phash) -> (description, created)
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def get(self, phash, bucket):
+        """Returns the description of the nearest cached image within max_distance, or None."""
+        now = time.time()
+        with self._lock:
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (_, created) in list(self._entries.items()):
+                if now - created > self.ttl_seconds:
+                    del self._entries[key]
+                    self._counters["expired"] += 1
+                    continue
+                if key[0] != bucket:
+                    continue
+                distance = (key[1] ^ phash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+            if best_key is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._counters["hits"] += 1
+            return self._entries[best_key][0]
+
+    def put(self, phash, bucket, description):
+        with self._lock:
+            self._entries[(bucket, phash)] = (description, time.time())
+            self._entries.move_to_end((bucket, phash))
+            self._counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["entries"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_description_cache():
+    """Process-wide DescriptionCache shared by every session (see audio_cache.get_audio_cache)."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = DescriptionCache()
+        return _shared_cache
@@ -0,0 +1,395 @@
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import trace
+
+# PyPDF2 is imported inside the functions that use it: it adds ~100 ms to every cold start,
+# and most sessions never upload a document
+
+# Bump whenever extraction output changes, so cached results from the old parsers are not reused
+PARSER_VERSION = 3
+SUPPORTED_KINDS = ("pdf", "docx", "txt")
+
+# --- PDF extraction settings ---
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", min(4, os.cpu_count() or 1)))  # Processes for large PDFs
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 40))  # Below this, extract in-process
+PDF_PAGES_PER_TASK = 8  # Pages handed to a worker process at a time
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+_worker_pdf = (None, None)  # In a worker process: (path, PdfReader) of the document it read last
+
+
+class PageRangeError(ValueError):
+    """Raised for a malformed or out-of-range page selection."""
+
+
+def parse_page_range(spec, total_pages):
+    """Parses a page selection like "1-5, 8, 10-" into sorted 0-based page indices.
+
+    An empty spec selects every page. Raises PageRangeError for malformed or out-of-range input.
+    """
+    if not spec or not spec.strip():
+        return list(range(total_pages))
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r"(\d*)\s*-\s*(\d*)", part)
+        if match:
+            start = int(match.group(1) or 1)
+            end = int(match.group(2) or total_pages)
+        elif part.isdigit():
+            start = end = int(part)
+        else:
+            raise PageRangeError(f"'{part}' is not a page number or range")
+        if start < 1 or end > total_pages or start > end:
+            raise PageRangeError(f"'{part}' is outside pages 1-{total_pages}")
+        pages.update(range(start - 1, end))
+    return sorted(pages)
+
+
+def pdf_page_count(file_bytes):
+    import PyPDF2
+    return len(PyPDF2.PdfReader(io.BytesIO(file_bytes)).pages)
+
+
+def _get_pdf_pool(workers):
+    """Process-wide pool, started on first use so worker start-up is paid once, not per upload."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # "spawn" rather than fork: forking the multi-threaded Streamlit server can deadlock the children
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+
+def _extract_page_batch(pdf_path, page_indices):
+    """Worker-process entry point: extracts the text of a batch of pages.
+
+    Each worker parses a document once and keeps it for the later batches of the same upload.
+    """
+    global _worker_pdf
+    import PyPDF2
+    path, reader = _worker_pdf
+    if path != pdf_path:
+        reader = PyPDF2.PdfReader(pdf_path)
+        _worker_pdf = (pdf_path, reader)
+    return [reader.pages[index].extract_text() or "" for index in page_indices]
+
+
+def iter_pdf_pages(file_bytes, page_indices=None, workers=PDF_WORKERS):
+    """Yields (page_index, text) in page order.
+
+    Large selections are fanned out to a process pool in batches; pages are still
+    yielded in order, and stopping iteration early cancels the batches not yet started.
+    The workers read the document from a temporary file rather than receiving its bytes
+    with every batch.
+    Raises PyPDF2.errors.PdfReadError for corrupted or encrypted files.
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+    if page_indices is None:
+        page_indices = range(len(reader.pages))
+    page_indices = list(page_indices)
+
+    if workers <= 1 or len(page_indices) < PDF_PARALLEL_MIN_PAGES:
+        for index in page_indices:
+            yield index, reader.pages[index].extract_text() or ""
+        return
+
+    batches = [page_indices[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(page_indices), PDF_PAGES_PER_TASK)]
+    executor = _get_pdf_pool(workers)
+    # A unique name per upload, so a worker never mistakes a new document for the one it has parsed
+    fd, pdf_path = tempfile.mkstemp(prefix=f"pdf-{uuid.uuid4().hex}-", suffix=".pdf")
+    with os.fdopen(fd, "wb") as pdf_file:
+        pdf_file.write(file_bytes)
+    futures = []
+    try:
+        futures = [executor.submit(_extract_page_batch, pdf_path, batch) for batch in batches]
+        for batch, future in zip(batches, futures):
+            yield from zip(batch, future.result())
+    finally:
+        for future in futures:
+            future.cancel()
+        os.remove(pdf_path)  # A batch still running has nobody waiting for its result
+
+
+# --- PDF boilerplate removal ---
+PDF_BOILERPLATE_SAMPLE_PAGES = 12  # Pages examined to learn the running headers and footers
+PDF_EDGE_LINES = 3  # Lines at the top and at the bottom of a page that may be header/footer
+PDF_REPEAT_FRACTION = 0.5  # An edge line found on at least this share of sampled pages is boilerplate
+_PAGE_NUMBER = r"^[\W_]*(?i:page\s*)?({})(\s*(?i:of|/)\s*\d{{1,4}})?[\W_]*$"
+_ROMAN = r"(?=[ivxlcdm])m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})"  # Well-formed only
+PAGE_NUMBER_LINE = re.compile(_PAGE_NUMBER.format(r"\d{1,4}"))
+# "xiv" or "XIV", never "Civil": and since "I" or "LI" can still be ordinary text, a Roman numeral
+# line is only dropped at an edge where most sampled pages have one (see PdfPageCleaner.learn)
+ROMAN_PAGE_NUMBER_LINE = re.compile(_PAGE_NUMBER.format(_ROMAN + "|" + _ROMAN.upper()))
+HYPHENATED_BREAK = re.compile(r"([^\W\d_])-\n([^\W\d_])")
+
+
+def _boilerplate_key(line):
+    """Running headers differ only in their numbers ("Chapter 2 - page 14"), so compare without them."""
+    return re.sub(r"\d+", "#", line.lower())
+
+
+class PdfPageCleaner:
+    """Strips what PyPDF2 extracts but nobody wants read aloud: running headers and footers,
+    page numbers, words hyphenated across line breaks and runs of whitespace.
+
+    learn() finds the header/footer lines repeated across a sample of pages, and the edges
+    (top, bottom) that carry Roman page numbers; clean() then removes them (and Arabic page
+    numbers) from the top and bottom of each page. `removed` counts the characters dropped so far.
+    """
+
+    def __init__(self):
+        self.boilerplate = set()
+        self.roman_edges = set()  # 0 (top) and/or 1 (bottom)
+        self.removed = 0
+
+    @staticmethod
+    def _edge_lines(lines, edge=None):
+        content = [line for line in lines if line]
+        top, bottom = content[:PDF_EDGE_LINES], content[-PDF_EDGE_LINES:]
+        return (top, bottom)[edge] if edge is not None else top + bottom
+
+    def learn(self, page_texts):
+        pages = [[" ".join(line.split()) for line in text.splitlines()] for text in page_texts if text.strip()]
+        if len(pages) < 3:
+            return  # Too few pages to tell a running header from a repeated sentence
+        counts = {}
+        for lines in pages:
+            for key in {_boilerplate_key(line) for line in self._edge_lines(lines)}:
+                counts[key] = counts.get(key, 0) + 1
+        threshold = max(2, math.ceil(len(pages) * PDF_REPEAT_FRACTION))
+        self.boilerplate = {key for key, count in counts.items() if count >= threshold}
+        self.roman_edges = {
+            edge for edge in (0, 1)
+            if sum(1 for lines in pages
+                   if any(ROMAN_PAGE_NUMBER_LINE.match(line) for line in self._edge_lines(lines, edge))) >= threshold
+        }
+
+    def _is_boilerplate(self, line, edge):
+        return (bool(PAGE_NUMBER_LINE.match(line)) or _boilerplate_key(line) in self.boilerplate
+                or (edge in self.roman_edges and bool(ROMAN_PAGE_NUMBER_LINE.match(line))))
+
+    def clean(self, page_text):
+        lines = [" ".join(line.split()) for line in page_text.splitlines()]
+        for edge, order in enumerate((range(len(lines)), range(len(lines) - 1, -1, -1))):  # Top, then bottom
+            dropped = 0
+            for i in order:
+                if not lines[i]:
+                    continue
+                if dropped == PDF_EDGE_LINES or not self._is_boilerplate(lines[i], edge):
+                    break
+                lines[i] = ""
+                dropped += 1
+        text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+        # "photo-\nsynthesis" -> "photosynthesis", but "Jean-\nPaul" keeps its hyphen
+        text = HYPHENATED_BREAK.sub(lambda m: m.group(1) + m.group(2) if m.group(2).islower() else m.group(0), text)
+        self.removed += len(page_text) - len(text)
+        return text
+
+
+def _clean_pdf_pages(pages, cleaner):
+    """Cleans (page_index, text) pairs, learning the boilerplate from the first sample of pages."""
+    try:
+        sample = list(itertools.islice(pages, PDF_BOILERPLATE_SAMPLE_PAGES))
+        cleaner.learn(text for _, text in sample)
+        for index, text in itertools.chain(sample, pages):
+            yield index, cleaner.clean(text)
+    finally:
+        pages.close()
+
+
+def extract_pdf_text(file_bytes, char_budget=None, page_indices=None, workers=PDF_WORKERS):
+    """Extracts the cleaned text of the selected pages, stopping as soon as `char_budget` is exceeded.
+
+    Returns (text, pages_read, truncated, chars_removed). When truncated, `text` holds what was
+    read so far. The budget applies to the cleaned text, so boilerplate does not count against it.
+    """
+    parts, length, pages_read = [], 0, 0
+    cleaner = PdfPageCleaner()
+    pages = _clean_pdf_pages(iter_pdf_pages(file_bytes, page_indices, workers=workers), cleaner)
+    try:
+        for _, page_text in pages:
+            pages_read += 1
+            if not page_text:
+                continue
+            parts.append(page_text + "\n\n")
+            length += len(page_text) + 2
+            if char_budget is not None and length > char_budget:
+                return "".join(parts), pages_read, True, cleaner.removed
+        return "".join(parts), pages_read, False, cleaner.removed
+    finally:
+        pages.close()  # Stops the page workers when the budget ends reading early
+
+
+# --- DOCX and TXT ---
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+DOCX_RUN_TEXT = {W_NS + "tab": "\t", W_NS + "br": "\n", W_NS + "cr": "\n", W_NS + "noBreakHyphen": "-"}
+DOCX_PART_ROOTS = (W_NS + "body", W_NS + "hdr", W_NS + "ftr")
+DOCX_BLOCKS = (W_NS + "tc", W_NS + "txbxContent")  # Table cells and text boxes: their paragraphs are read as one line
+
+
+def _iter_docx_part(stream):
+    """Yields the paragraphs of one DOCX XML part in document order, without building the whole tree.
+
+    Deleted text and field codes are skipped (only w:t is read), and so is the legacy copy of
+    every text box that Word stores under mc:Fallback. Finished elements are cleared as they
+    close, so memory stays flat however long the document is.
+    """
+    runs = []  # Text pieces of each open paragraph, innermost last
+    blocks = []  # Paragraphs of each open table cell or text box, innermost last
+    fallback_depth = properties_depth = depth = 0
+    root, root_depth = None, None
+    for event, element in ET.iterparse(stream, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            depth += 1
+            if tag == W_NS + "p":
+                runs.append([])
+            elif tag in DOCX_BLOCKS:
+                blocks.append([])
+            elif tag == W_NS + "pPr":
+                properties_depth += 1  # Tab stops in paragraph properties are also <w:tab>
+            elif tag == MC_FALLBACK:
+                fallback_depth += 1
+            elif tag in DOCX_PART_ROOTS and root is None:
+                root, root_depth = element, depth
+            continue
+
+        depth -= 1
+        text = None
+        if tag == W_NS + "t":
+            if runs:
+                runs[-1].append(element.text or "")
+        elif tag in DOCX_RUN_TEXT:
+            if runs and not properties_depth:
+                runs[-1].append(DOCX_RUN_TEXT[tag])
+        elif tag == W_NS + "p":
+            text = "".join(runs.pop())
+        elif tag in DOCX_BLOCKS:
+            text = "\n".join(paragraph for paragraph in blocks.pop() if paragraph.strip()) or None
+        elif tag == W_NS + "pPr":
+            properties_depth -= 1
+        elif tag == MC_FALLBACK:
+            fallback_depth -= 1
+
+        if text is not None and not fallback_depth:
+            if blocks:
+                blocks[-1].append(text)
+            else:
+                yield text
+        if root is not None and depth == root_depth:
+            root.clear()  # A top-level paragraph or table is done with
+
+
+def _docx_part_names(archive):
+    """word/document.xml, preceded by the page headers and followed by the page footers."""
+    names = archive.namelist()
+
+    def numbered(prefix):
+        parts = [name for name in names if re.fullmatch(rf"word/{prefix}\d*\.xml", name)]
+        return sorted(parts, key=lambda name: int(re.sub(r"\D", "", name) or 0))
+
+    return numbered("header") + ["word/document.xml"] + numbered("footer")
+
+
+def iter_docx_paragraphs(file_bytes):
+    """Yields the text of a DOCX paragraph by paragraph, in reading order, straight from the zip.
+
+    Covers body paragraphs, tables (one line per cell), text boxes, and headers and footers
+    (each distinct one once, before and after the body). Raises zipfile.BadZipFile, KeyError
+    or xml.etree.ElementTree.ParseError for an unreadable file.
+    """
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive:
+        seen_margins = set()
+        for name in _docx_part_names(archive):
+            with archive.open(name) as part:
+                if name == "word/document.xml":
+                    yield from _iter_docx_part(part)
+                    continue
+                # Headers/footers repeat on every page, and first/even/odd variants are often identical
+                text = "\n".join(paragraph for paragraph in _iter_docx_part(part) if paragraph.strip())
+                if text and text not in seen_margins:
+                    seen_margins.add(text)
+                    yield text
+
+
+def extract_docx_text(file_bytes, char_budget=None):
+    """Extracts the text of a DOCX, stopping as soon as `char_budget` is exceeded.
+
+    Returns (text, truncated). When truncated, `text` holds what was read so far.
+    """
+    parts, length = [], 0
+    for paragraph in iter_docx_paragraphs(file_bytes):
+        parts.append(paragraph)
+        length += len(paragraph) + 1
+        if char_budget is not None and length > char_budget:
+            return "\n".join(parts), True
+    return "\n".join(parts), False
+
+
+def decode_text_file(file_bytes):
+    """Decodes a TXT upload as UTF-8, falling back to Latin-1. Returns (text, encoding)."""
+    try:
+        return file_bytes.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        return file_bytes.decode("latin-1"), "latin-1"
+
+
+# --- Any supported file ---
+def document_kind(file_name):
+    """Returns "pdf", "docx" or "txt" from the file extension, or None if unsupported."""
+    extension = os.path.splitext(file_name.lower())[1].lstrip(".")
+    return extension if extension in SUPPORTED_KINDS else None
+
+
+def extract_document(file_bytes, kind, char_budget=None, page_range=""):
+    """Extracts the text of a PDF, DOCX or TXT file.
+
+    Returns (text, truncated, note): `truncated` is True if the text exceeds `char_budget`
+    (PDFs and DOCX files stop reading at that point), and `note` is a short remark for the user
+    or None. Raises PageRangeError for a bad PDF page selection, PyPDF2.errors.PdfReadError for
+    an unreadable PDF, and zipfile/XML errors for an unreadable DOCX.
+    """
+    with trace(f"extract_{kind or 'unknown'}", bytes_in=len(file_bytes)) as span:
+        text, truncated, note = _extract_document(file_bytes, kind, char_budget, page_range)
+        span.update(chars_out=len(text), truncated=truncated)
+        return text, truncated, note
+
+
+def _extract_document(file_bytes, kind, char_budget, page_range):
+    if kind == "pdf":
+        page_indices = parse_page_range(page_range, pdf_page_count(file_bytes))
+        text, pages_read, truncated, removed = extract_pdf_text(
+            file_bytes, char_budget=char_budget, page_indices=page_indices
+        )
+        notes = []
+        if truncated:
+            notes.append(f"Stopped after {pages_read} of {len(page_indices)} selected pages.")
+        if removed:
+            notes.append(f"Removed {removed:,} characters of page numbers, headers/footers and extra spacing.")
+        return text, truncated, " ".join(notes) or None
+    if kind == "docx":
+        text, truncated = extract_docx_text(file_bytes, char_budget=char_budget)
+        return text, truncated, None
+    if kind == "txt":
+        text, encoding = decode_text_file(file_bytes)
+        note = "Decoded TXT as Latin-1." if encoding == "latin-1" else None
+    else:
+        raise ValueError(f"Unsupported file type: {kind}")
+    return text, char_budget is not None and len(text) > char_budget, note
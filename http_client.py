@@ -0,0 +1,62 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import log_event
+
+# --- Configuration (overridable through environment variables) ---
+POOL_HOSTS = int(os.environ.get("HTTP_POOL_HOSTS", 4))  # Number of per-host pools kept
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 16))  # Keep-alive connections kept per host
+WARM_UP_ENABLED = os.environ.get("HTTP_WARM_UP", "1") != "0"
+WARM_UP_CONNECTIONS = int(os.environ.get("HTTP_WARM_UP_CONNECTIONS", 2))  # Connections pre-opened per host
+WARM_UP_URLS = ("https://api.openai.com/", "https://api.lemonfox.ai/")
+
+_session = None
+_session_lock = threading.Lock()
+_warm_up_started = False
+
+
+def get_session():
+    """Process-wide requests.Session with keep-alive connection pools shared by every session and thread.
+
+    A lock-guarded module singleton (like audio_cache.get_audio_cache) so TTS worker threads,
+    which have no ScriptRunContext for st.cache_resource, share the same pools.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _open_connection(url):
+    try:
+        # Any response will do: reading it fully returns the TLS connection to the pool
+        get_session().head(url, timeout=5).close()
+    except requests.exceptions.RequestException as e:
+        log_event("connection_warm_up_failed", level="warning", url=url, error=str(e))
+
+
+def warm_up(urls=WARM_UP_URLS, connections=WARM_UP_CONNECTIONS):
+    """Pre-opens `connections` keep-alive connections to each URL's host. Blocks until done."""
+    with ThreadPoolExecutor(max_workers=max(1, len(urls) * connections)) as executor:
+        for url in urls:
+            for _ in range(connections):
+                executor.submit(_open_connection, url)
+
+
+def start_warm_up():
+    """Runs warm_up() once per process in a background thread, unless HTTP_WARM_UP=0."""
+    global _warm_up_started
+    with _session_lock:
+        if _warm_up_started or not WARM_UP_ENABLED:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name="http-warm-up", daemon=True).start()
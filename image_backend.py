@@ -1,14 +1,134 @@
-import openai
 import base64
+import hashlib
 import requests
-import litellm
 import streamlit as st  # Import streamlit
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rate_limiter import admitted_post, report_waits, wait_callback
+from metrics import log_event, trace
+from description_cache import get_description_cache, perceptual_hash
+from single_flight import FlightCancelled, get_single_flight
 
-litellm.set_verbose = True
+# --- Image preprocessing settings ---
+DEFAULT_DETAIL = "auto"  # OpenAI vision detail level: "low", "high" or "auto"
+VISION_IMAGE_FORMAT = os.environ.get("VISION_IMAGE_FORMAT", "JPEG")  # "JPEG" or "WEBP"
+VISION_IMAGE_QUALITY = int(os.environ.get("VISION_IMAGE_QUALITY", 85))
+LOW_DETAIL_MAX_EDGE = 512  # The model only ever sees 512x512 at detail="low"
+HIGH_DETAIL_MAX_EDGE = 2048  # At "high"/"auto" images are fit into 2048x2048...
+HIGH_DETAIL_MAX_SHORT_EDGE = 768  # ...and then scaled so the short side is at most 768px
 
+# Bump whenever the prompts below change, so cached descriptions from the old prompts are not reused
+PROMPT_VERSION = 1
 
-def look_at_photo(base64_image, upload=False):
-    model = "gpt-4o" if upload else "gpt-4o-mini"  # Correct model selection
+
+# Rough request size for the OpenAI tokens-per-minute limiter. OpenAI counts max_tokens up front;
+# an image costs 85 tokens at detail="low" and typically 765 (four 512px tiles) otherwise.
+PROMPT_TOKENS = 120
+IMAGE_TOKENS = {"low": 85}
+DEFAULT_IMAGE_TOKENS = 765
+
+OPENAI_CHAT_URL = os.environ.get("OPENAI_CHAT_URL", "https://api.openai.com/v1/chat/completions")
+
+# --- Latency-budgeted routing ---
+# Seconds a description should take, by mode: a camera capture is waited on by someone holding
+# up a phone (simple_app.py, simple_2.py and app.py's camera); an app.py upload can take longer
+VISION_BUDGET_SECONDS = {
+    "camera": float(os.environ.get("VISION_CAMERA_BUDGET_SECONDS", 6)),
+    "upload": float(os.environ.get("VISION_UPLOAD_BUDGET_SECONDS", 30)),
+}
+# Candidate (model, detail) routes, best description first; detail None keeps the caller's.
+# The figures (seconds to the first token, output tokens per second) estimate a route's latency
+# until VISION_LATENCY_MIN_SAMPLES requests have been timed, and always size its max_tokens.
+VISION_ROUTES = {
+    ("gpt-4o", None): (1.5, 50),
+    ("gpt-4o-mini", None): (1.0, 80),
+    ("gpt-4o-mini", "low"): (0.6, 80),
+}
+VISION_TYPICAL_TOKENS = 250  # Length of a typical description, for the prior estimates
+VISION_MIN_TOKENS = 150  # max_tokens is never set below this, however tight the budget
+VISION_MAX_TOKENS = 4000
+VISION_TIMEOUT_FACTOR = 3  # A request is abandoned after this many times its mode's budget
+VISION_LATENCY_WINDOW = 200  # Recent request durations kept per route
+VISION_LATENCY_MIN_SAMPLES = 20
+# Hedging: a request still running at this percentile of its route's latency is raced
+# against a second request to the fastest route; the first description back is used
+VISION_HEDGE = os.environ.get("VISION_HEDGE", "1") == "1"
+VISION_HEDGE_PERCENTILE = float(os.environ.get("VISION_HEDGE_PERCENTILE", 0.9))
+
+
+class _LatencyWindow:
+    """Durations of the most recent successful requests, per (model, detail) route."""
+
+    def __init__(self, size=VISION_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._size = size
+
+    def record(self, route, seconds):
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=self._size)).append(seconds)
+
+    def percentile(self, route, fraction):
+        """The `fraction` percentile of the route's recent durations, or None without enough samples."""
+        with self._lock:
+            ordered = sorted(self._samples.get(route, ()))
+        if len(ordered) < VISION_LATENCY_MIN_SAMPLES:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_route_latency = _LatencyWindow()
+_first_token_latency = _LatencyWindow()  # Seconds to the first streamed token, which is when a stream is hedged
+# Runs hedged requests, so the caller can wait on whichever of the two finishes first
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="vision-hedge")
+
+
+def _estimated_seconds(route_key, detail):
+    """p95 of the route's recent requests, or its prior estimate for a typical description."""
+    model, route_detail = route_key
+    observed = _route_latency.percentile((model, route_detail or detail), 0.95)
+    if observed is not None:
+        return observed
+    first_token_seconds, tokens_per_second = VISION_ROUTES[route_key]
+    return first_token_seconds + VISION_TYPICAL_TOKENS / tokens_per_second
+
+
+def choose_vision_route(upload=False, detail=DEFAULT_DETAIL):
+    """Picks how to describe an image within its mode's latency budget.
+
+    Returns (primary, hedge, hedge_after, timeout). primary and hedge are (model, detail,
+    max_tokens) routes; hedge is None when hedging is off, otherwise it is sent if primary is
+    still running after hedge_after seconds. `detail` is the level the image was encoded for:
+    a route may lower it, never raise it.
+    """
+    budget = VISION_BUDGET_SECONDS["upload" if upload else "camera"]
+    keys = [key for key in VISION_ROUTES if key[1] is None or detail != "low"]
+    estimates = {key: _estimated_seconds(key, detail) for key in keys}
+    fastest = min(keys, key=estimates.get)
+    chosen = next((key for key in keys if estimates[key] <= budget), fastest)
+
+    def route(key):
+        model, route_detail = key
+        first_token_seconds, tokens_per_second = VISION_ROUTES[key]
+        max_tokens = int(max(0.0, budget - first_token_seconds) * tokens_per_second)
+        return model, route_detail or detail, min(VISION_MAX_TOKENS, max(VISION_MIN_TOKENS, max_tokens))
+
+    primary = route(chosen)
+    hedge = route(fastest) if VISION_HEDGE else None
+    hedge_after = _route_latency.percentile(primary[:2], VISION_HEDGE_PERCENTILE) or budget
+    return primary, hedge, hedge_after, budget * VISION_TIMEOUT_FACTOR
+
+
+def _vision_request(base64_image, model, detail, max_tokens=VISION_MAX_TOKENS, stream=False):
+    """Headers and JSON payload for a chat completion describing `base64_image`."""
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {st.secrets['OPENAI_API_KEY']}"  # Use st.secrets
@@ -35,35 +155,402 @@ def look_at_photo(base64_image, upload=False):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
+                            "url": f"data:{sniff_image_mime(base64_image)};base64,{base64_image}",
+                            "detail": detail
                         }
                     }
                 ]
             }
         ],
-        "max_tokens": 4000
+        "max_tokens": max_tokens
     }
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+
+def _estimated_tokens(payload, detail):
+    return PROMPT_TOKENS + IMAGE_TOKENS.get(detail, DEFAULT_IMAGE_TOKENS) + payload["max_tokens"]
+
+
+def _flight_key(base64_image, model, detail):
+    return ("vision", model, PROMPT_VERSION, detail, hashlib.sha256(base64_image.encode("ascii")).hexdigest())
+
 
+def _trim_to_sentence(text):
+    """Drops an unfinished last sentence (e.g. from a description cut off at max_tokens), if there is an earlier one."""
+    ends = [match.end() for match in re.finditer(r"[.!?](?=\s|$)", text)]
+    return text[:ends[-1]] if ends else text
+
+
+def _fetch_description(base64_image, route, timeout):
+    """One non-streaming vision request along a (model, detail, max_tokens) route.
+
+    Returns (description, http_status, response_bytes, complete); complete is False if the
+    description hit max_tokens, in which case its unfinished last sentence is dropped.
+    Raises on failure, like stream_photo_description.
+    """
+    model, detail, max_tokens = route
+    headers, payload = _vision_request(base64_image, model, detail, max_tokens)
+    started = time.perf_counter()
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+        # Queued behind the shared OpenAI limiter; 429/503 responses wait out Retry-After and retry
+        response = admitted_post("openai", _estimated_tokens(payload, detail), OPENAI_CHAT_URL,
+                                 headers=headers, json=payload, timeout=timeout)
         response.raise_for_status()
         response_data = response.json()
-        if 'choices' in response_data:
-            return response_data['choices'][0]['message']['content']
-        else:
-            print("Response does not contain 'choices' key")
-            return "An unexpected response was received from the API."
-    except requests.exceptions.RequestException as e:
-        print(f"API request failed: {e}")
+        if 'choices' not in response_data:
+            raise ValueError("Response does not contain 'choices' key")
+    except Exception:
+        # A failing or timed-out route counts as taking the whole timeout, so it stops being chosen
+        _route_latency.record((model, detail), timeout)
+        raise
+    _route_latency.record((model, detail), time.perf_counter() - started)
+    choice = response_data['choices'][0]
+    description = choice['message']['content']
+    complete = choice.get("finish_reason") != "length"
+    if not complete:
+        description = _trim_to_sentence(description)
+    return description, response.status_code, len(response.content), complete
+
+
+def _fetch_hedged(base64_image, primary, hedge, hedge_after, timeout, span):
+    """Sends `primary`, and `hedge` too if primary is still running after `hedge_after` seconds.
+
+    Returns (description, route, complete) from whichever succeeds first (see _fetch_description); raises the first error if both fail.
+    The slower request is left to finish in the background (it still feeds the latency window).
+    Without a hedge the request is simply made on the calling thread.
+    """
+    if hedge is None:
+        description, span["status"], span["bytes_out"], complete = _fetch_description(base64_image, primary, timeout)
+        return description, primary, complete
+
+    # Both requests run on the pool, so their rate-limiter waits are relayed to this thread's report_waits callback
+    callback = wait_callback()
+    notices = queue.SimpleQueue()
+
+    def fetch(route):
+        with report_waits(lambda provider, seconds: notices.put((provider, seconds))):
+            return _fetch_description(base64_image, route, timeout)
+
+    pending = {_hedge_pool.submit(fetch, primary): primary}
+    hedge_at = time.monotonic() + hedge_after
+    error = None
+    while pending:
+        if hedge is not None and time.monotonic() >= hedge_at:
+            span["hedged"] = True
+            pending[_hedge_pool.submit(fetch, hedge)] = hedge
+            hedge = None
+        poll = 0.25 if hedge is None else max(0.0, min(0.25, hedge_at - time.monotonic()))
+        done, _ = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+        while not notices.empty():
+            provider, seconds = notices.get()
+            if callback:
+                callback(provider, seconds)
+        for future in done:
+            route = pending.pop(future)
+            try:
+                description, span["status"], span["bytes_out"], complete = future.result()
+                return description, route, complete
+            except Exception as e:
+                error = error or e
+    raise error
+
+
+def describe_photo(base64_image, upload=False, detail=DEFAULT_DETAIL):
+    """Returns a description of the image. Failures raise (requests.exceptions.RequestException,
+    or ValueError for a malformed response); look_at_photo turns them into a message instead."""
+    # Model, detail and output cap come from the mode's latency budget (see choose_vision_route)
+    primary, hedge, hedge_after, timeout = choose_vision_route(upload, detail)
+    model, detail, max_tokens = primary
+
+    with trace("vision", model=model, detail=detail, max_tokens=max_tokens, bytes_in=len(base64_image)) as span:
+        # The same photo already being described for another session is waited for, not sent again
+        key = _flight_key(base64_image, model, detail)
+        flights = get_single_flight()
+        while True:
+            flight, leader = flights.join(key)
+            if leader:
+                break
+            try:
+                description = "".join(part for part in flight.follow() if part)
+            except FlightCancelled:
+                continue  # The leading session gave up; make the request ourselves
+            span["cache"] = "coalesced"
+            span["chars_out"] = len(description)
+            return description
+
+        with flights.lead(key, flight):
+            # Re-snaps of the same worksheet or diagram are answered from the description cache
+            phash = perceptual_hash(base64.b64decode(base64_image))
+            cache_bucket = (model, PROMPT_VERSION, detail)
+            description = None
+            if phash is not None:
+                description = get_description_cache().get(phash, cache_bucket)
+                span["cache"] = "miss" if description is None else "hit"
+            if description is None:
+                # A slow request is raced against one to the fastest route (see _fetch_hedged)
+                description, route, complete = _fetch_hedged(base64_image, primary, hedge, hedge_after, timeout, span)
+                span["route"] = "/".join(str(part) for part in route)
+                if not complete:
+                    span["truncated"] = True  # Cut off at max_tokens: spoken up to its last full sentence, never cached
+                elif phash is not None and description:
+                    # Filed under the route that answered: a hedge's cheaper description never poses as the primary's
+                    get_description_cache().put(phash, (route[0], PROMPT_VERSION, route[1]), description)
+            span["chars_out"] = len(description or "")
+            flight.publish(description)
+            return description
+
+
+def look_at_photo(base64_image, upload=False, detail=DEFAULT_DETAIL):
+    """Like describe_photo, but returns a short message for the listener instead of raising."""
+    try:
+        return describe_photo(base64_image, upload=upload, detail=detail)
+    except requests.exceptions.RequestException:
         return "An error occurred while processing the image."
-    except ValueError as e:
-        print(f"Invalid response: {e}")
+    except ValueError:
         return "An unexpected response was received from the API."
-    except Exception as e: #Catch any other errors
-        print(f"An unexpected error occurred: {e}")
+    except Exception: #Catch any other errors (describe_photo's span records the details)
         return "An unexpected error occurred."
 
 
-def encode_image_from_bytes(image_bytes):
-    """Encodes image bytes to base64."""
-    return base64.b64encode(image_bytes).decode('utf-8')
+class _VisionStream:
+    """One streaming vision request, read on the hedge pool so the caller can race two of them.
+
+    Everything arrives on the shared `events` queue as (stream, item): each text delta, then
+    None at the end, or the exception that stopped it. Rate-limiter waits arrive as
+    (None, (provider, seconds)) for the caller to pass to its own report_waits callback.
+    """
+
+    def __init__(self, base64_image, route, timeout, events):
+        self.route = route
+        self.complete = True  # False once the model reports hitting max_tokens
+        self.status = None
+        self._events = events
+        self._stop = threading.Event()
+        self._started = time.perf_counter()
+        self._first_token = None
+        _hedge_pool.submit(self._run, base64_image, timeout)
+
+    def abandon(self, lost_race=False):
+        """Stops reading. A stream that lost the race counts as taking at least as long as it ran."""
+        if lost_race and not self._stop.is_set() and self._first_token is None:
+            _route_latency.record(self.route[:2], time.perf_counter() - self._started)
+            _first_token_latency.record(self.route[:2], time.perf_counter() - self._started)
+        self._stop.set()
+
+    def _run(self, base64_image, timeout):
+        model, detail, max_tokens = self.route
+        headers, payload = _vision_request(base64_image, model, detail, max_tokens, stream=True)
+        try:
+            with report_waits(lambda provider, seconds: self._events.put((None, (provider, seconds)))):
+                with admitted_post("openai", _estimated_tokens(payload, detail), OPENAI_CHAT_URL,
+                                   headers=headers, json=payload, stream=True, timeout=timeout) as response:
+                    self.status = response.status_code
+                    response.raise_for_status()
+                    for line in response.iter_lines(decode_unicode=True):
+                        if self._stop.is_set():
+                            return
+                        if not line or not line.startswith("data:"):
+                            continue  # Blank separators and SSE comments
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or []
+                        delta = choices[0].get("delta", {}).get("content") if choices else None
+                        if choices and choices[0].get("finish_reason") == "length":
+                            self.complete = False
+                        if delta:
+                            if self._first_token is None:
+                                self._first_token = time.perf_counter() - self._started
+                                _first_token_latency.record((model, detail), self._first_token)
+                            self._events.put((self, delta))
+        except Exception as e:
+            if not self._stop.is_set():
+                _route_latency.record((model, detail), timeout)  # As in _fetch_description
+                self._events.put((self, e))
+            return
+        if not self._stop.is_set():
+            _route_latency.record((model, detail), time.perf_counter() - self._started)
+        self._events.put((self, None))
+
+
+def _stream_hedged(base64_image, primary, hedge, hedge_after, timeout, span):
+    """Streams `primary`, racing it against `hedge` if no token has arrived after `hedge_after` seconds.
+
+    Yields the deltas of whichever stream produces text first (the other is abandoned) and
+    returns that _VisionStream; raises the first error if both fail before any text.
+    """
+    callback = wait_callback()
+    events = queue.SimpleQueue()
+    streams = [_VisionStream(base64_image, primary, timeout, events)]
+    hedge_at = time.monotonic() + hedge_after
+    winner, error, running = None, None, 1
+    try:
+        while True:
+            if hedge is not None and winner is None and time.monotonic() >= hedge_at:
+                span["hedged"] = True
+                streams.append(_VisionStream(base64_image, hedge, timeout, events))
+                hedge, running = None, running + 1
+            poll = 0.25 if hedge is None or winner is not None else max(0.0, min(0.25, hedge_at - time.monotonic()))
+            try:
+                stream, item = events.get(timeout=poll)
+            except queue.Empty:
+                continue
+            if stream is None:
+                if callback:
+                    callback(*item)
+                continue
+            if winner is None and not isinstance(item, Exception):
+                winner = stream  # First text (or a finished, empty reply) wins the race
+                for other in streams:
+                    if other is not winner:
+                        other.abandon(lost_race=True)
+            if stream is not winner:
+                if winner is None:  # Failed before any text
+                    span["status"] = stream.status
+                    error, running = error or item, running - 1
+                    if not running:
+                        raise error
+                continue
+            if isinstance(item, Exception):
+                span["status"] = stream.status
+                raise item
+            if item is None:
+                return winner
+            yield item
+    finally:
+        for stream in streams:
+            stream.abandon()
+
+
+def stream_photo_description(base64_image, upload=False, detail=DEFAULT_DETAIL):
+    """Streaming variant of look_at_photo: yields the description piece by piece as it is generated.
+
+    A cached description is yielded in one piece; one already being generated for another
+    session is relayed as it arrives, and ends early if that session stops it part-way.
+    A request with no text by its route's usual time to the first token is raced against
+    one to the fastest route (see _stream_hedged). Unlike look_at_photo, failures raise
+    (requests.exceptions.RequestException, or ValueError for a malformed stream).
+    """
+    primary, hedge, hedge_after, timeout = choose_vision_route(upload, detail)
+    model, detail, max_tokens = primary
+    # Streams are hedged on their first token, so on how long that usually takes on this route
+    hedge_after = _first_token_latency.percentile(primary[:2], VISION_HEDGE_PERCENTILE) or hedge_after
+    with trace("vision_stream", model=model, detail=detail, max_tokens=max_tokens, bytes_in=len(base64_image)) as span:
+        started = time.perf_counter()
+        key = _flight_key(base64_image, model, detail)
+        flights = get_single_flight()
+        while True:
+            flight, leader = flights.join(key)
+            if leader:
+                break
+            span["cache"] = "coalesced"
+            span["chars_out"] = 0
+            try:
+                for part in flight.follow():
+                    if part:
+                        span["chars_out"] += len(part)
+                        yield part
+                return
+            except FlightCancelled:
+                if span["chars_out"]:
+                    # The leading session stopped mid-description: keep what was relayed rather than fail
+                    span["truncated"] = True
+                    return
+                # The leading session gave up before generating anything; make the request ourselves
+
+        with flights.lead(key, flight):
+            phash = perceptual_hash(base64.b64decode(base64_image))
+            cache_bucket = (model, PROMPT_VERSION, detail)
+            if phash is not None:
+                cached_description = get_description_cache().get(phash, cache_bucket)
+                span["cache"] = "miss" if cached_description is None else "hit"
+                if cached_description is not None:
+                    span["chars_out"] = len(cached_description)
+                    flight.publish(cached_description)
+                    yield cached_description
+                    return
+
+            parts = []
+            deltas = _stream_hedged(base64_image, primary, hedge, hedge_after, timeout, span)
+            try:
+                while True:
+                    try:
+                        delta = next(deltas)
+                    except StopIteration as finished:
+                        stream = finished.value
+                        break
+                    if not parts:
+                        span["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(delta)
+                    flight.publish(delta)
+                    yield delta
+            finally:
+                deltas.close()  # Stops reading the upstream streams
+
+            description = "".join(parts)
+            span["status"] = stream.status
+            span["route"] = "/".join(str(part) for part in stream.route)
+            span["chars_out"] = len(description)
+            if not stream.complete:
+                span["truncated"] = True  # Cut off at max_tokens; already spoken, but not cached as a full description
+            elif phash is not None and description:
+                get_description_cache().put(phash, (stream.route[0], PROMPT_VERSION, stream.route[1]), description)
+
+
+def _target_size(width, height, detail):
+    """Largest size the vision model actually uses for an image of this size at this detail level."""
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_MAX_EDGE / max(width, height))
+    else:
+        scale = min(1.0, HIGH_DETAIL_MAX_EDGE / max(width, height), HIGH_DETAIL_MAX_SHORT_EDGE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def preprocess_image(image_bytes, detail=DEFAULT_DETAIL, image_format=VISION_IMAGE_FORMAT, quality=VISION_IMAGE_QUALITY):
+    """Applies EXIF orientation, downsizes to what the vision model uses and re-encodes as JPEG/WebP.
+
+    Returns the original bytes if they cannot be decoded, or if they are already a JPEG/WebP
+    that needs neither rotating nor resizing.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        needs_rotation = image.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+        target = _target_size(image.width, image.height, detail)
+        if image.format in ("JPEG", "WEBP") and not needs_rotation and target == image.size:
+            return image_bytes
+        image = ImageOps.exif_transpose(image)
+        target = _target_size(image.width, image.height, detail)
+        if image.mode not in ("RGB", "L"):
+            background = Image.new("RGB", image.size, "white")  # Flatten transparency onto white
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        if target != image.size:
+            image = image.resize(target, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=quality, optimize=image_format == "JPEG")
+        return output.getvalue()
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        log_event("image_preprocess_skipped", error=str(e))
+        return image_bytes
+
+
+def sniff_image_mime(base64_image):
+    """Returns the MIME type of a base64-encoded image from its magic bytes (defaults to JPEG)."""
+    head = base64.b64decode(base64_image[:24])
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def encode_image_from_bytes(image_bytes, detail=DEFAULT_DETAIL):
+    """Preprocesses image bytes for the vision model and encodes them to base64."""
+    with trace("encode_image", detail=detail, bytes_in=len(image_bytes)) as span:
+        encoded = base64.b64encode(preprocess_image(image_bytes, detail=detail)).decode('utf-8')
+        span["bytes_out"] = len(encoded)
+        return encoded
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration (overridable through environment variables) ---
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 16))  # Conversions running at once, across all sessions
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("JOB_RESULT_TTL_SECONDS", 3600))  # Uncollected finished jobs kept this long
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class Job:
+    """One background conversion. The worker reports progress through it; sessions poll it by id.
+
+    Streamed output (e.g. audio as it arrives) can be added with add_partial() so a poller
+    can start playback before the job finishes.
+    """
+
+    def __init__(self, label=""):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.status = "queued"
+        self.progress = (0, 0)  # (done, total) parts; total 0 while unknown
+        self.message = None  # Latest notice for the user, e.g. an estimated queueing wait
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._partial = bytearray()
+        self._finished = threading.Event()
+        self._cancel_requested = threading.Event()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+
+    def report(self, done=None, total=None, message=None):
+        """Called by the worker: updates the progress counters and/or the user notice ("" clears it)."""
+        with self._lock:
+            if done is not None:
+                self.progress = (done, total if total is not None else self.progress[1])
+            if message is not None:
+                self.message = message
+
+    def add_partial(self, data):
+        with self._lock:
+            self._partial += data
+
+    def partial(self):
+        """Everything added with add_partial() so far."""
+        with self._lock:
+            return bytes(self._partial)
+
+    def cancel(self):
+        """Asks the worker to stop; it checks cancel_requested between steps."""
+        self._cancel_requested.set()
+
+    def wait(self, timeout=None):
+        """Blocks until the job has finished; returns False on timeout."""
+        return self._finished.wait(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self.status, self.result, self.error = status, result, error
+            self.finished_at = time.time()
+            self._partial = bytearray()  # The result supersedes it
+        self._finished.set()
+
+
+class JobExecutor:
+    """Process-wide pool that runs conversions outside the Streamlit script thread.
+
+    A session submits work, keeps only the job id in st.session_state and polls it on later
+    reruns, so widget interaction neither interrupts nor repeats a long conversion, and the
+    script thread is free again as soon as the job is queued.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, ttl_seconds=JOB_RESULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._counters = {"submitted": 0, "done": 0, "failed": 0, "cancelled": 0, "discarded": 0, "expired": 0}
+
+    def submit(self, fn, *args, label="", **kwargs):
+        """Runs fn(job, *args, **kwargs) in the background and returns the new job's id.
+
+        fn's return value becomes job.result. An exception marks the job failed (job.error);
+        returning after job.cancel() marks it cancelled.
+        """
+        job = Job(label)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+            self._counters["submitted"] += 1
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            status, result, error = "failed", None, e
+        else:
+            status, error = ("cancelled" if job.cancel_requested else "done"), None
+        job._finish(status, result, error)
+        with self._lock:
+            self._counters[status] += 1
+
+    def get(self, job_id):
+        """The job with this id, or None if it is unknown or expired."""
+        if not job_id:
+            return None
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        """Forgets a finished job once its session has collected the result, releasing it right away.
+
+        Results can be large (a whole conversion's audio), so callers should not leave them to expire.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+                self._counters["discarded"] += 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+            self._counters["expired"] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["active"] = sum(1 for job in self._jobs.values() if not job.finished)
+        return snapshot
+
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    """Process-wide JobExecutor shared by every session (see audio_cache.get_audio_cache)."""
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = JobExecutor()
+        return _shared_executor
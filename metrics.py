@@ -0,0 +1,174 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration (overridable through environment variables) ---
+JSON_LOG_ENABLED = os.environ.get("METRICS_JSON_LOG", "1") != "0"  # One JSON line per stage on stderr
+METRICS_FILE = os.environ.get("METRICS_FILE")  # Prometheus text file, e.g. for node_exporter's textfile collector
+METRICS_FILE_INTERVAL_SECONDS = float(os.environ.get("METRICS_FILE_INTERVAL_SECONDS", 15))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))  # Serves /metrics on this port when set
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_durations = {}  # stage -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (metric name, sorted label items) -> value
+_exporter_started = False
+
+_logger = logging.getLogger("tts_st.metrics")
+if JSON_LOG_ENABLED and not _logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+
+def log_event(event, level="info", **fields):
+    """Writes one structured JSON log line at `level` ("info", "warning", "error").
+
+    Warnings and errors are written even with METRICS_JSON_LOG=0 (then through logging's default stderr handler).
+    """
+    if JSON_LOG_ENABLED or level != "info":
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, "level": level, **fields}, default=str)
+        getattr(_logger, level)(line)
+
+
+def _count(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def record(stage, seconds, span):
+    """Adds one finished stage to the aggregated metrics and the JSON log.
+
+    Recognized span fields: outcome, cache ("hit"/"miss"/"coalesced"), status (upstream HTTP status),
+    bytes_in and bytes_out. Any other fields only go to the log.
+    """
+    with _lock:
+        counts = _durations.setdefault(stage, [0] * (len(DURATION_BUCKETS) + 2))
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+        counts[-2] += 1
+        counts[-1] += seconds
+        _count("tts_st_stage_total", stage=stage, outcome=span.get("outcome", "ok"))
+        if span.get("cache"):
+            _count("tts_st_cache_lookups_total", stage=stage, result=span["cache"])
+        if span.get("status"):
+            _count("tts_st_upstream_responses_total", stage=stage, status=str(span["status"]))
+        for direction in ("in", "out"):
+            if span.get(f"bytes_{direction}"):
+                _count("tts_st_payload_bytes_total", span[f"bytes_{direction}"], stage=stage, direction=direction)
+    log_event("stage", stage=stage, duration_ms=round(seconds * 1000, 1), **span)
+
+
+@contextlib.contextmanager
+def trace(stage, **fields):
+    """Times the enclosed block as `stage`. Yields a dict the block can add span fields to.
+
+    Exceptions mark the span as an error and propagate; closing a generator early
+    (GeneratorExit) marks it as cancelled.
+    """
+    span = dict(fields)
+    started = time.perf_counter()
+    try:
+        yield span
+    except GeneratorExit:
+        span.setdefault("outcome", "cancelled")
+        raise
+    except BaseException as e:
+        span.setdefault("outcome", "error")
+        span.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        span.setdefault("outcome", "ok")
+        record(stage, time.perf_counter() - started, span)
+
+
+def _labels(items):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}" if items else ""
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        durations = {stage: list(counts) for stage, counts in _durations.items()}
+        counters = dict(_counters)
+    lines = [
+        "# HELP tts_st_stage_duration_seconds Time spent in each pipeline stage.",
+        "# TYPE tts_st_stage_duration_seconds histogram",
+    ]
+    for stage, counts in sorted(durations.items()):
+        for bound, count in zip(DURATION_BUCKETS, counts):
+            lines.append(f'tts_st_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'tts_st_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {counts[-2]}')
+        lines.append(f'tts_st_stage_duration_seconds_count{{stage="{stage}"}} {counts[-2]}')
+        lines.append(f'tts_st_stage_duration_seconds_sum{{stage="{stage}"}} {counts[-1]:.6f}')
+    help_text = {
+        "tts_st_stage_total": "Finished stages by outcome.",
+        "tts_st_cache_lookups_total": "Cache lookups by stage and result.",
+        "tts_st_upstream_responses_total": "Upstream API responses by HTTP status.",
+        "tts_st_payload_bytes_total": "Bytes sent to (in) and produced by (out) each stage.",
+    }
+    for name, text in help_text.items():
+        series = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+        if series:
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} counter"]
+            lines += [f"{name}{_labels(labels)} {value}" for labels, value in series]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Writes render_prometheus() to `path` atomically (readers never see a partial file)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _write_file_forever():
+    while True:
+        try:
+            write_prometheus(METRICS_FILE)
+        except OSError as e:
+            log_event("metrics_file_failed", path=METRICS_FILE, error=str(e))
+        time.sleep(METRICS_FILE_INTERVAL_SECONDS)
+
+
+def start_exporter():
+    """Starts the Prometheus file writer (METRICS_FILE) and/or /metrics server (METRICS_PORT)
+    once per process, in background threads. Does nothing if neither is configured."""
+    global _exporter_started
+    with _lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if METRICS_FILE:
+        threading.Thread(target=_write_file_forever, name="metrics-file", daemon=True).start()
+    if METRICS_PORT:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), _MetricsHandler)
+        except OSError as e:
+            log_event("metrics_server_failed", port=METRICS_PORT, error=str(e))
+            return
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
@@ -0,0 +1,190 @@
+import contextlib
+import email.utils
+import os
+import threading
+import time
+
+import requests
+
+from http_client import get_session
+
+# --- Configuration (overridable through environment variables) ---
+# Defaults sit just under the providers' usual account limits, so a classroom queues here
+# instead of receiving 429s. Raise them to match your plan.
+PROVIDER_LIMITS = {
+    # provider: (requests per second, billed units per minute, unit)
+    "lemonfox": (
+        float(os.environ.get("LEMONFOX_REQUESTS_PER_SECOND", 5)),
+        int(os.environ.get("LEMONFOX_CHARS_PER_MINUTE", 300000)),
+        "chars",
+    ),
+    "openai": (
+        float(os.environ.get("OPENAI_REQUESTS_PER_SECOND", 5)),
+        int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 200000)),
+        "tokens",
+    ),
+}
+MAX_WAIT_SECONDS = float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", 120))  # Longer queues fail fast
+THROTTLE_RETRIES = int(os.environ.get("RATE_LIMIT_THROTTLE_RETRIES", 3))  # Extra attempts after a 429/503
+WAIT_NOTICE_SECONDS = 1.0  # Shorter waits are not worth telling the user about
+THROTTLE_STATUSES = (429, 503)
+
+_wait_reporter = threading.local()
+
+
+class RateLimitTimeout(requests.exceptions.RequestException):
+    """Raised instead of queueing when the estimated wait exceeds MAX_WAIT_SECONDS."""
+
+
+class TokenBucket:
+    """Refills continuously at `rate` units per second up to `capacity`.
+
+    Admission may drive the balance negative: later callers then wait for the debt to be
+    repaid, which queues them in arrival order and makes their wait predictable.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, units, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # An oversized request waits for a full bucket rather than forever
+        return max(0.0, (min(units, self.capacity) - self.tokens) / self.rate)
+
+    def consume(self, units):
+        self.tokens -= min(units, self.capacity)
+
+
+class ProviderLimiter:
+    """Process-wide admission control for one API: a request-rate bucket, a billed-units
+    bucket (characters or tokens per minute) and any Retry-After the provider has sent."""
+
+    def __init__(self, name, requests_per_second, units_per_minute, unit, max_wait=MAX_WAIT_SECONDS):
+        self.name = name
+        self.unit = unit
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self._units = TokenBucket(units_per_minute / 60, units_per_minute)
+        self._blocked_until = 0.0
+        self._counters = {"admitted": 0, "queued": 0, "wait_seconds": 0.0, "throttled": 0, "rejected": 0}
+
+    def estimated_wait(self, units=1):
+        """Seconds a request for `units` would currently have to wait."""
+        with self._lock:
+            return self._wait_time(units, time.monotonic())
+
+    def _wait_time(self, units, now):
+        return max(self._requests.wait_time(1, now), self._units.wait_time(units, now), self._blocked_until - now)
+
+    def acquire(self, units=1):
+        """Blocks until a request for `units` may be sent and returns the seconds waited.
+
+        Raises RateLimitTimeout, without taking a place in the queue, if the wait would exceed max_wait.
+        """
+        with self._lock:
+            wait = self._wait_time(units, time.monotonic())
+            if wait > self.max_wait:
+                self._counters["rejected"] += 1
+                raise RateLimitTimeout(f"{self.name} is busy: estimated wait {wait:.0f}s exceeds {self.max_wait:.0f}s")
+            self._requests.consume(1)
+            self._units.consume(units)
+            self._counters["admitted"] += 1
+            if wait > 0:
+                self._counters["queued"] += 1
+                self._counters["wait_seconds"] += wait
+        if wait > 0:
+            callback = getattr(_wait_reporter, "callback", None)
+            notify = callback and wait >= WAIT_NOTICE_SECONDS
+            if notify:
+                callback(self.name, wait)
+            time.sleep(wait)
+            if notify:
+                callback(self.name, 0)  # Admitted: the notice can go
+        return wait
+
+    def throttled(self, response, fallback_seconds=1.0):
+        """Records a 429/503: nobody is admitted until its Retry-After (or `fallback_seconds`) has passed."""
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        with self._lock:
+            self._counters["throttled"] += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + (delay if delay is not None else fallback_seconds))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    """Process-wide ProviderLimiter for "lemonfox" or "openai" (see audio_cache.get_audio_cache)."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter(provider, *PROVIDER_LIMITS[provider])
+        return _limiters[provider]
+
+
+def admitted_post(provider, units, url, retries=THROTTLE_RETRIES, **kwargs):
+    """POSTs through the shared session once `provider`'s limiter admits the request.
+
+    A 429/503 blocks the provider for its Retry-After and the request queues again, up to
+    `retries` times; the last response is returned whatever its status (callers still
+    call raise_for_status). `units` is the request's characters or estimated tokens.
+    """
+    limiter = get_limiter(provider)
+    for attempt in range(retries + 1):
+        limiter.acquire(units)
+        response = get_session().post(url, **kwargs)
+        if response.status_code not in THROTTLE_STATUSES or attempt == retries:
+            return response
+        limiter.throttled(response, fallback_seconds=2 ** attempt)
+        response.close()
+
+
+@contextlib.contextmanager
+def report_waits(callback):
+    """Calls `callback(provider, seconds)` whenever this thread is queued for a second or more,
+    and `callback(provider, 0)` once it has been admitted.
+
+    Used by the apps to show an estimated wait instead of a spinner that seems stuck.
+    Only waits in the calling thread are reported, not those of TTS worker threads.
+    """
+    previous = getattr(_wait_reporter, "callback", None)
+    _wait_reporter.callback = callback
+    try:
+        yield
+    finally:
+        _wait_reporter.callback = previous
+
+
+def wait_callback():
+    """The callback report_waits installed for this thread, or None."""
+    return getattr(_wait_reporter, "callback", None)
+
+
+def limiter_stats():
+    """Counters of every limiter in use, by provider."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
@@ -1,7 +1,12 @@
 import streamlit as st
 import requests
-import base64
-from image_backend import look_at_photo, encode_image_from_bytes # Assuming these are correct
+from image_backend import look_at_photo, encode_image_from_bytes, stream_photo_description # Assuming these are correct
+from tts_backend import AUDIO_FORMATS, stream_long_speech, pipeline_speech
+from audio_player import client_audio_format, play_while_streaming
+from audio_store import get_audio_store
+from http_client import start_warm_up
+from metrics import start_exporter
+from rate_limiter import report_waits
 import io
 
 # --- Import the new camera component ---
@@ -11,15 +16,23 @@ from streamlit_back_camera_input import back_camera_input
 # --- Config ---
 st.set_page_config(page_title="Camera to Speech", layout="centered")
 LEMONFOX_API_KEY = st.secrets.get("LEMONFOX_API_KEY")
-LEMONFOX_API_URL = "https://api.lemonfox.ai/v1/audio/speech"
 VOICE = "bella"
 TTS_MODEL = "tts-1"
+VISION_DETAIL = "auto" # OpenAI vision detail level ("low", "high" or "auto"); images are downscaled to match
+QUEUED_MESSAGE = "⏳ Busy right now. Starting in about {seconds:.0f} seconds..."
+PIPELINED_SPEECH = True # Speak each sentence of the description while the rest is still being written
+AUDIO_FORMAT = client_audio_format() # Smallest format this browser plays: less to download on school Wi-Fi
+AUDIO_MIME = AUDIO_FORMATS[AUDIO_FORMAT][0]
 
 # --- Basic Error Checking for Secrets ---
 if not LEMONFOX_API_KEY:
     st.error("🚨 Error: LEMONFOX_API_KEY not found in Streamlit secrets. TTS will fail.")
     # st.stop()
 
+# Pre-open keep-alive connections to OpenAI and Lemonfox (once per process, in the background)
+start_warm_up()
+start_exporter() # Prometheus metrics file/endpoint, if METRICS_FILE or METRICS_PORT is set
+
 # --- Reintroduce CSS Styling for st.button ---
 st.markdown("""
     <style>
@@ -57,16 +70,15 @@ st.markdown("""
 # ----------------------------------------------------------
 
 # --- TTS ---
-def text_to_speech(text):
+def text_to_speech(text, preview_slot=None):
     # (Same function as before)
     if not LEMONFOX_API_KEY: st.error("Cannot generate speech: LEMONFOX_API_KEY is missing."); return None, "API Key Missing"
     if not text: st.warning("No text description provided to generate speech."); return None, "No Input Text"
-    headers = {"Authorization": f"Bearer {LEMONFOX_API_KEY}", "Content-Type": "application/json"}
-    data = {"model": TTS_MODEL, "input": text, "voice": VOICE, "response_format": "mp3"}
     try:
-        response = requests.post(LEMONFOX_API_URL, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        return response.content, None
+        fragments = stream_long_speech(text, VOICE, LEMONFOX_API_KEY, model=TTS_MODEL, response_format=AUDIO_FORMAT, timeout=60)
+        # Starts playback in preview_slot as soon as the first frames arrive
+        audio_data, st.session_state.audio_start_time = play_while_streaming(fragments, preview_slot, AUDIO_FORMAT)
+        return audio_data, None
     except requests.exceptions.RequestException as e: st.error(f"Audio generation failed: {e}"); return None, f"Audio API Error: {e}"
     except Exception as e: st.error(f"An unexpected error occurred during TTS: {e}"); return None, f"TTS Error: {e}"
 
@@ -74,18 +86,34 @@ def text_to_speech(text):
 def analyze_image(image_bytes):
     # (Same function as before)
     try:
-        base64_image = encode_image_from_bytes(image_bytes)
+        base64_image = encode_image_from_bytes(image_bytes, detail=VISION_DETAIL)
         if not base64_image: return None, "Failed to encode image."
-        description = look_at_photo(base64_image, upload=False)
+        description = look_at_photo(base64_image, upload=False, detail=VISION_DETAIL)
         if not description or "error" in description.lower(): return None, f"Image analysis failed: {description}"
         return description, None
     except Exception as e: return None, f"Analysis Error: {e}"
 
+# --- Pipelined Analysis + TTS ---
+def describe_and_speak(image_bytes, preview_slot=None):
+    # Streams the description and synthesizes each finished sentence while the rest is still being written
+    if not LEMONFOX_API_KEY: return None, "API Key Missing"
+    try:
+        base64_image = encode_image_from_bytes(image_bytes, detail=VISION_DETAIL)
+        if not base64_image: return None, "Failed to encode image."
+        description_stream = stream_photo_description(base64_image, upload=False, detail=VISION_DETAIL)
+        fragments = pipeline_speech(description_stream, VOICE, LEMONFOX_API_KEY, model=TTS_MODEL, response_format=AUDIO_FORMAT, timeout=60)
+        audio_data, st.session_state.audio_start_time = play_while_streaming(fragments, preview_slot, AUDIO_FORMAT)
+        if not audio_data: return None, "Image analysis failed: empty description."
+        return audio_data, None
+    except requests.exceptions.RequestException as e: return None, f"Analysis/Audio API Error: {e}"
+    except Exception as e: return None, f"Analysis Error: {e}"
+
 # --- State Initialization ---
 if "app_state" not in st.session_state: st.session_state.app_state = "capture"
 if "image_bytes_to_process" not in st.session_state: st.session_state.image_bytes_to_process = None
-if "audio_data" not in st.session_state: st.session_state.audio_data = None
+if "audio_key" not in st.session_state: st.session_state.audio_key = None # Key into the shared audio store
 if "error_message" not in st.session_state: st.session_state.error_message = None
+if "audio_start_time" not in st.session_state: st.session_state.audio_start_time = 0
 
 # ==============================================================================
 # --- Main App Logic based on State ---
@@ -108,15 +136,24 @@ if st.session_state.app_state == "capture":
 
 # --- State 2: Processing ---
 elif st.session_state.app_state == "processing":
-    with st.spinner("Analyzing image and generating audio..."):
-        if st.session_state.image_bytes_to_process:
+    preview_slot = st.empty() # Speech starts playing here while it is still streaming
+    wait_notice = st.empty() # Estimated wait, if requests are queued behind other users
+    show_wait = lambda provider, seconds: wait_notice.info(QUEUED_MESSAGE.format(seconds=seconds)) if seconds else wait_notice.empty()
+    with st.spinner("Analyzing image and generating audio..."), report_waits(show_wait):
+        if st.session_state.image_bytes_to_process and PIPELINED_SPEECH:
+            audio, err = describe_and_speak(st.session_state.image_bytes_to_process, preview_slot=preview_slot)
+            if err: st.session_state.error_message = err; st.session_state.app_state = "error"
+            else: st.session_state.audio_key = get_audio_store().put(audio, AUDIO_MIME); st.session_state.app_state = "playback"
+            st.session_state.image_bytes_to_process = None
+            st.rerun()
+        elif st.session_state.image_bytes_to_process:
             description, analysis_err = analyze_image(st.session_state.image_bytes_to_process)
             if analysis_err:
                 st.session_state.error_message = analysis_err; st.session_state.app_state = "error"
             else:
-                audio, tts_err = text_to_speech(description)
+                audio, tts_err = text_to_speech(description, preview_slot=preview_slot)
                 if tts_err: st.session_state.error_message = tts_err; st.session_state.app_state = "error"
-                else: st.session_state.audio_data = audio; st.session_state.app_state = "playback"
+                else: st.session_state.audio_key = get_audio_store().put(audio, AUDIO_MIME); st.session_state.app_state = "playback"
             st.session_state.image_bytes_to_process = None
             st.rerun()
         else: # Should not happen
@@ -124,8 +161,9 @@ elif st.session_state.app_state == "processing":
 
 # --- State 3: Playback ---
 elif st.session_state.app_state == "playback":
-    if st.session_state.audio_data:
-        audio_b64 = base64.b64encode(st.session_state.audio_data).decode("utf-8")
+    # Served by URL (with range requests) from the shared store rather than inlined as base64
+    audio_src = get_audio_store().url(st.session_state.audio_key)
+    if audio_src:
         # --- Play Button (HTML Component - verify height) ---
         st.components.v1.html(f"""
             <div style="display: flex; flex-direction: column; align-items: center; width: 100%;">
@@ -136,7 +174,7 @@ elif st.session_state.app_state == "playback":
                     display: flex; align-items: center; justify-content: center;
                     margin-bottom: 15px; cursor: pointer; line-height: 1.2; text-align: center;
                 ">▶️ PLAY AUDIO</button>
-                <audio id="player" src="data:audio/mp3;base64,{audio_b64}" controls style="display:none; width: 80%; max-width: 600px;"></audio>
+                <audio id="player" src="{audio_src}" controls style="display:none; width: 80%; max-width: 600px;"></audio>
                 <script>
                     /* Same JS as before */
                     const btn = document.getElementById("playAudio"), player = document.getElementById("player");
@@ -144,6 +182,11 @@ elif st.session_state.app_state == "playback":
                         btn.addEventListener("click", () => {{ if (player.paused) player.play().catch(e => console.error("Audio play failed:", e)); else player.pause(); }});
                         window.playListenerAttached = true;
                     }}
+                    const resumeAt = {st.session_state.audio_start_time}; /* Where the streaming preview had got to */
+                    if (player && resumeAt > 0) {{
+                        const resume = () => {{ player.currentTime = resumeAt; player.play().catch(e => console.error("Audio resume failed:", e)); }};
+                        if (player.readyState >= 1) resume(); else player.addEventListener("loadedmetadata", resume, {{ once: true }});
+                    }}
                 </script>
             </div>
         """, height=220) # Adjusted component height slightly
@@ -154,7 +197,7 @@ elif st.session_state.app_state == "playback":
     # --- Use st.button for Start Over (Styled via CSS) ---
     if st.button("🔄 START OVER", key="st_start_over"):
          st.session_state.app_state = "capture"
-         st.session_state.audio_data = None
+         st.session_state.audio_key = None
          st.session_state.error_message = None
          st.components.v1.html("<script>window.playListenerAttached = false;</script>", height=0)
          st.rerun()
@@ -168,6 +211,6 @@ elif st.session_state.app_state == "error":
     if st.button("🔄 TRY AGAIN", key="st_try_again"):
          st.session_state.app_state = "capture"
          st.session_state.error_message = None
-         st.session_state.audio_data = None
+         st.session_state.audio_key = None
          st.rerun()
     # ----------------------------------------------------
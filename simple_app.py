@@ -1,25 +1,34 @@
 import streamlit as st
-import requests
-import base64
 import io
+from tts_backend import AUDIO_FORMATS, stream_long_speech, pipeline_speech
+from audio_player import client_audio_format, play_while_streaming
+from audio_store import get_audio_store
+from http_client import start_warm_up
+from metrics import start_exporter
+from rate_limiter import report_waits
 
 # --- Try importing backend functions ---
 try:
-    from image_backend import look_at_photo, encode_image_from_bytes
+    from image_backend import look_at_photo, encode_image_from_bytes, stream_photo_description
     BACKEND_LOADED = True
 except ImportError:
     st.error("FATAL ERROR: image_backend.py not found.")
-    def encode_image_from_bytes(byte_data): return None
-    def look_at_photo(base64_image, upload=False): return "Error: Backend not loaded."
+    def encode_image_from_bytes(byte_data, detail="auto"): return None
+    def look_at_photo(base64_image, upload=False, detail="auto"): return "Error: Backend not loaded."
+    def stream_photo_description(base64_image, upload=False, detail="auto"): raise RuntimeError("Backend not loaded.")
     BACKEND_LOADED = False
 
 # --- Configuration & Constants ---
 st.set_page_config(layout="wide")
 
-LEMONFOX_API_URL = "https://api.lemonfox.ai/v1/audio/speech"
 TTS_MODEL = "tts-1"
 DEFAULT_VOICE = "alloy"
-MAX_CHAR_LIMIT = 4000
+MAX_CHAR_LIMIT = 20000 # Longer descriptions are split into parallel TTS chunks
+VISION_DETAIL = "auto" # OpenAI vision detail level ("low", "high" or "auto"); images are downscaled to match
+QUEUED_MESSAGE = "⏳ Busy right now. Starting in about {seconds:.0f} seconds..."
+PIPELINED_SPEECH = True # Speak each sentence of the description while the rest is still being written
+AUDIO_FORMAT = client_audio_format() # Smallest format this browser plays: less to download on school Wi-Fi
+AUDIO_MIME = AUDIO_FORMATS[AUDIO_FORMAT][0]
 
 # --- API Keys Check ---
 missing_keys = []
@@ -29,6 +38,10 @@ LEMONFOX_API_KEY = st.secrets.get("LEMONFOX_API_KEY")
 if not OPENAI_API_KEY: missing_keys.append("OPENAI_API_KEY")
 if not LEMONFOX_API_KEY: missing_keys.append("LEMONFOX_API_KEY")
 
+# Pre-open keep-alive connections to OpenAI and Lemonfox (once per process, in the background)
+start_warm_up()
+start_exporter() # Prometheus metrics file/endpoint, if METRICS_FILE or METRICS_PORT is set
+
 # --- Custom CSS Injection ---
 # CHANGES MADE HERE: Modified Camera Input CSS, Added Preview Size CSS
 hide_streamlit_style = """
@@ -112,37 +125,53 @@ hide_streamlit_style = """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
 # --- Helper Functions (TTS and Analysis - unchanged) ---
-def text_to_speech_simple(text, voice_key):
+def text_to_speech_simple(text, voice_key, preview_slot=None):
     if not LEMONFOX_API_KEY: return None, "TTS API Key missing."
     if not text: return None, "No text to speak."
     if len(text) > MAX_CHAR_LIMIT: return None, f"Text too long ({len(text)} > {MAX_CHAR_LIMIT})."
-    headers = {"Authorization": f"Bearer {LEMONFOX_API_KEY}", "Content-Type": "application/json"}
-    data = {"model": TTS_MODEL, "input": text, "voice": voice_key, "response_format": "mp3"}
     try:
-        response = requests.post(LEMONFOX_API_URL, headers=headers, json=data, timeout=45)
-        response.raise_for_status()
-        return response.content, None
+        fragments = stream_long_speech(text, voice_key, LEMONFOX_API_KEY, model=TTS_MODEL, response_format=AUDIO_FORMAT, timeout=45)
+        # Starts playback in preview_slot as soon as the first frames arrive
+        audio_data, st.session_state.audio_start_time = play_while_streaming(fragments, preview_slot, AUDIO_FORMAT)
+        return audio_data, None
     except Exception as e: return None, f"TTS Error: {e}"
 
 def perform_image_analysis_simple(image_bytes):
     if not OPENAI_API_KEY: return None, "Analysis API Key missing."
     if not image_bytes: return None, "No image data."
     try:
-        base64_image = encode_image_from_bytes(image_bytes)
+        base64_image = encode_image_from_bytes(image_bytes, detail=VISION_DETAIL)
         if not base64_image: return None, "Image encoding failed."
-        description = look_at_photo(base64_image, upload=False)
+        description = look_at_photo(base64_image, upload=False, detail=VISION_DETAIL)
         if description and "error" not in description.lower() and "fail" not in description.lower():
             return description, None
         else: return None, f"Analysis failed: {description or 'No response.'}"
     except Exception as e: return None, f"Analysis Error: {e}"
 
+def describe_and_speak_simple(image_bytes, voice_key, preview_slot=None):
+    """Pipelined analysis + TTS: the description is streamed and each finished sentence is
+    synthesized (and starts playing in preview_slot) while the rest is still being written."""
+    if not OPENAI_API_KEY: return None, "Analysis API Key missing."
+    if not LEMONFOX_API_KEY: return None, "TTS API Key missing."
+    if not image_bytes: return None, "No image data."
+    try:
+        base64_image = encode_image_from_bytes(image_bytes, detail=VISION_DETAIL)
+        if not base64_image: return None, "Image encoding failed."
+        description_stream = stream_photo_description(base64_image, upload=False, detail=VISION_DETAIL)
+        fragments = pipeline_speech(description_stream, voice_key, LEMONFOX_API_KEY, model=TTS_MODEL, response_format=AUDIO_FORMAT, timeout=45)
+        audio_data, st.session_state.audio_start_time = play_while_streaming(fragments, preview_slot, AUDIO_FORMAT)
+        if not audio_data: return None, "Analysis failed: No response."
+        return audio_data, None
+    except Exception as e: return None, f"Analysis/TTS Error: {e}"
+
 # --- Initialize Session State ---
 if "photo_buffer" not in st.session_state: st.session_state.photo_buffer = None
 if "processing" not in st.session_state: st.session_state.processing = False
-if "audio_data" not in st.session_state: st.session_state.audio_data = None
+if "audio_key" not in st.session_state: st.session_state.audio_key = None # Key into the shared audio store
 if "error_message" not in st.session_state: st.session_state.error_message = None
 if "show_play" not in st.session_state: st.session_state.show_play = False
 if "camera_key" not in st.session_state: st.session_state.camera_key = "cam_initial"
+if "audio_start_time" not in st.session_state: st.session_state.audio_start_time = 0
 
 # --- Main App Logic ---
 
@@ -165,29 +194,31 @@ if not st.session_state.show_play and not st.session_state.processing:
 
 # State 2: Processing photo
 elif st.session_state.processing:
-    with st.spinner("Thinking..."):
-        description, analysis_error = perform_image_analysis_simple(st.session_state.photo_buffer)
+    preview_slot = st.empty() # Speech starts playing here while it is still streaming
+    wait_notice = st.empty() # Estimated wait, if requests are queued behind other users
+    show_wait = lambda provider, seconds: wait_notice.info(QUEUED_MESSAGE.format(seconds=seconds)) if seconds else wait_notice.empty()
+    with st.spinner("Thinking..."), report_waits(show_wait):
+        if PIPELINED_SPEECH:
+            audio_data, error = describe_and_speak_simple(st.session_state.photo_buffer, DEFAULT_VOICE, preview_slot=preview_slot)
+        else:
+            description, error = perform_image_analysis_simple(st.session_state.photo_buffer)
+            if not error:
+                audio_data, error = text_to_speech_simple(description, DEFAULT_VOICE, preview_slot=preview_slot)
         st.session_state.photo_buffer = None # Clear buffer after use
-        if analysis_error:
-            st.session_state.error_message = analysis_error
+        if error:
+            st.session_state.error_message = error
             st.session_state.processing = False; st.session_state.show_play = False
             st.rerun()
         else:
-            audio_data, tts_error = text_to_speech_simple(description, DEFAULT_VOICE)
-            if tts_error:
-                st.session_state.error_message = tts_error
-                st.session_state.processing = False; st.session_state.show_play = False
-                st.rerun()
-            else:
-                st.session_state.audio_data = audio_data
-                st.session_state.processing = False; st.session_state.show_play = True
-                st.rerun()
+            st.session_state.audio_key = get_audio_store().put(audio_data, AUDIO_MIME)
+            st.session_state.processing = False; st.session_state.show_play = True
+            st.rerun()
 
 # State 3: Show Play button (using HTML Component) and Audio
 elif st.session_state.show_play:
-    if st.session_state.audio_data:
-        audio_base64 = base64.b64encode(st.session_state.audio_data).decode('utf-8')
-        audio_src = f"data:audio/mpeg;base64,{audio_base64}"
+    # Served by URL (with range requests) from the shared store rather than inlined as base64
+    audio_src = get_audio_store().url(st.session_state.audio_key)
+    if audio_src:
 
         # --- HTML Component (Unchanged from your original, should work fine) ---
         component_html = f"""
@@ -228,6 +259,16 @@ elif st.session_state.show_play:
             const playButton = document.getElementById('playButton');
             const audioPlayer = document.getElementById('audioPlayer');
             let isBound = document.body.hasAttribute('data-button-bound'); // Check if already bound
+            const resumeAt = {st.session_state.audio_start_time}; // Where the streaming preview had got to
+
+            if (audioPlayer && resumeAt > 0) {{
+                 const resume = () => {{
+                     audioPlayer.currentTime = resumeAt;
+                     audioPlayer.play().catch(e => console.error("Audio resume failed:", e));
+                 }};
+                 if (audioPlayer.readyState >= 1) resume();
+                 else audioPlayer.addEventListener('loadedmetadata', resume, {{ once: true }});
+            }}
 
             if (playButton && audioPlayer && !isBound) {{
                  playButton.addEventListener('click', function() {{
@@ -256,7 +297,7 @@ elif st.session_state.show_play:
     if st.button("🔄 START OVER", key="reset", type="secondary"):
         # Reset logic remains the same...
         st.session_state.photo_buffer = None; st.session_state.processing = False
-        st.session_state.audio_data = None; st.session_state.error_message = None
+        st.session_state.audio_key = None; st.session_state.error_message = None
         st.session_state.show_play = False
         st.session_state.camera_key = f"cam_{hash(st.session_state.camera_key)}"
         st.rerun()
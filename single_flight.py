@@ -0,0 +1,133 @@
+import contextlib
+import threading
+
+import requests
+
+
+class FlightCancelled(requests.exceptions.ConnectionError):
+    """The leading request was abandoned (e.g. its session reran) before it finished.
+
+    Followers that have not received anything yet issue the request themselves instead;
+    a follower cut off mid-stream sees an ordinary dropped connection, unless it chooses
+    to keep what it has (see image_backend.stream_photo_description).
+    """
+
+
+class Flight:
+    """One upstream request in progress, which identical callers attach to.
+
+    The leader publishes the result as it arrives (one piece, or many for a stream) and is
+    then finished, with or without an error. Followers receive every piece in order,
+    including those published before they attached.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._parts = []
+        self._done = False
+        self._error = None
+
+    def publish(self, part):
+        with self._condition:
+            self._parts.append(part)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+    def follow(self):
+        """Yields the published pieces as they arrive, then raises the leader's error, if any."""
+        index = 0
+        while True:
+            with self._condition:
+                while index == len(self._parts) and not self._done:
+                    self._condition.wait()
+                new_parts = self._parts[index:]
+                index = len(self._parts)
+                done, error = self._done, self._error
+            yield from new_parts
+            if done:
+                if error is not None:
+                    raise error  # Re-raised in every follower, like Future.result()
+                return
+
+
+class SingleFlight:
+    """Coalesces identical concurrent requests so only one of them reaches the API.
+
+    When a whole class converts the same handout within seconds, every session misses the
+    cache because nobody's result is in it yet. The first caller for a key becomes the
+    leader and makes the call; callers arriving while it is in flight follow it and get
+    its result (or its error) instead of making their own.
+
+        flight, leader = flights.join(key)
+        if leader:
+            with flights.lead(key, flight):
+                flight.publish(fetch())
+        else:
+            result = b"".join(flight.follow())
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._counters = {"led": 0, "coalesced": 0, "cancelled": 0}
+
+    def join(self, key):
+        """Returns (flight, True) if the caller must make the request, or (flight, False) to follow one in progress."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counters["coalesced"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self._counters["led"] += 1
+            return flight, True
+
+    @contextlib.contextmanager
+    def lead(self, key, flight):
+        """Wraps the leader's request: on exit the flight is finished and later callers start a new one.
+
+        Store the result in its cache inside this block, so nobody misses both the flight and the cache.
+        An exception is passed on to the followers; GeneratorExit, KeyboardInterrupt and the like cancel the flight.
+        """
+        try:
+            yield flight
+        except Exception as e:
+            self._end(key, flight, e)
+            raise
+        except BaseException:
+            self._end(key, flight, FlightCancelled("the shared request was cancelled"))
+            raise
+        else:
+            self._end(key, flight, None)
+
+    def _end(self, key, flight, error):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if isinstance(error, FlightCancelled):
+                self._counters["cancelled"] += 1
+        flight.finish(error)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["in_flight"] = len(self._flights)
+        return snapshot
+
+
+_shared_flights = None
+_shared_flights_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Process-wide SingleFlight shared by every session (see audio_cache.get_audio_cache)."""
+    global _shared_flights
+    with _shared_flights_lock:
+        if _shared_flights is None:
+            _shared_flights = SingleFlight()
+        return _shared_flights
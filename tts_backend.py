@@ -0,0 +1,639 @@
+import os
+import re
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from audio_cache import get_audio_cache, make_cache_key, normalize_text
+from metrics import trace
+from rate_limiter import THROTTLE_STATUSES, admitted_post
+from single_flight import FlightCancelled, get_single_flight
+
+LEMONFOX_API_URL = os.environ.get("LEMONFOX_API_URL", "https://api.lemonfox.ai/v1/audio/speech")
+TTS_MODEL = "tts-1"
+
+# --- Output formats ---
+# response_format: (MIME type, file extension, approximate kbps). The provider fixes each format's
+# bitrate; Opus is by far the smallest, AAC sits between Opus and MP3, and MP3 plays everywhere.
+AUDIO_FORMATS = {
+    "mp3": ("audio/mpeg", "mp3", 128),
+    "aac": ("audio/aac", "aac", 64),
+    "opus": ("audio/ogg", "opus", 32),
+}
+
+# --- Long-document settings ---
+TTS_CHUNK_CHARS = int(os.environ.get("TTS_CHUNK_CHARS", 4000))  # Upstream-friendly request size
+TTS_MAX_WORKERS = int(os.environ.get("TTS_MAX_WORKERS", 4))  # Concurrent Lemonfox requests per document
+TTS_CHUNK_RETRIES = int(os.environ.get("TTS_CHUNK_RETRIES", 2))  # Extra attempts per failed chunk
+# Chunk boundaries are chosen by content (see split_text_into_chunks), so after an edit only the
+# chunks around the changed sentences miss the cache. Chunks average roughly MIN + ODDS sentences.
+TTS_CHUNK_MIN_CHARS = int(os.environ.get("TTS_CHUNK_MIN_CHARS", 600))
+TTS_CHUNK_BOUNDARY_ODDS = int(os.environ.get("TTS_CHUNK_BOUNDARY_ODDS", 4))  # 1 in N sentences may end a chunk
+
+# --- Pipelining settings ---
+PIPELINE_MIN_CHARS = int(os.environ.get("TTS_PIPELINE_MIN_CHARS", 150))  # Batch size after the first sentence
+
+# --- Streaming settings ---
+STREAM_READ_BYTES = 8192  # iter_content block size
+STREAM_PREVIEW_SECONDS = float(os.environ.get("TTS_STREAM_PREVIEW_SECONDS", 2))  # Audio received before a preview plays
+
+def stream_preview_bytes(response_format):
+    """Size of STREAM_PREVIEW_SECONDS of audio in one of AUDIO_FORMATS, at its approximate bitrate."""
+    return int(STREAM_PREVIEW_SECONDS * AUDIO_FORMATS[response_format][2] * 1000 / 8)
+
+
+SENTENCE_END = re.compile(r"(?:(?<=[.!?…])|(?<=[.!?…][\"'”’)\]]))\s+")
+
+
+def synthesize_speech(text, voice_key, api_key, model=TTS_MODEL, response_format="mp3", timeout=60):
+    """Returns synthesized audio bytes for `text`, served from the shared cache when possible.
+
+    Identical requests already in flight in another session are waited for rather than repeated.
+    Raises requests.exceptions.RequestException if the Lemonfox call fails.
+    """
+    text = normalize_text(text)
+    with trace("tts", voice=voice_key, model=model, chars_in=len(text)) as span:
+        key = make_cache_key(text, voice_key, model, response_format)
+        flights = get_single_flight()
+        while True:
+            flight, leader = flights.join(("tts", key))
+            if leader:
+                break
+            try:
+                audio = b"".join(flight.follow())
+            except FlightCancelled:
+                continue  # The leading session gave up; make the request ourselves
+            span["cache"] = "coalesced"
+            span["bytes_out"] = len(audio)
+            return audio
+
+        with flights.lead(("tts", key), flight):
+            cache = get_audio_cache()
+            audio = cache.get(key)
+            span["cache"] = "miss" if audio is None else "hit"
+            if audio is None:
+                headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+                data = {"model": model, "input": text, "voice": voice_key, "response_format": response_format}
+                started = time.monotonic()
+                # Queued behind the shared Lemonfox limiter; 429/503 responses wait out Retry-After and retry
+                response = admitted_post("lemonfox", len(text), LEMONFOX_API_URL, headers=headers, json=data, timeout=timeout)
+                span["status"] = response.status_code
+                response.raise_for_status()
+                audio = response.content
+                cache.put(key, audio, synth_seconds=time.monotonic() - started, chars=len(text))
+            span["bytes_out"] = len(audio)
+            flight.publish(audio)
+            return audio
+
+
+def stream_speech(text, voice_key, api_key, model=TTS_MODEL, response_format="mp3", timeout=60):
+    """Yields audio bytes for `text` as they arrive from Lemonfox, caching the complete clip at the end.
+
+    A cache hit yields the whole clip at once. If another session is already streaming the same
+    clip, its bytes are relayed as they arrive. Raises requests.exceptions.RequestException on failure.
+    """
+    text = normalize_text(text)
+    with trace("tts_stream", voice=voice_key, model=model, chars_in=len(text)) as span:
+        key = make_cache_key(text, voice_key, model, response_format)
+        flights = get_single_flight()
+        while True:
+            flight, leader = flights.join(("tts", key))
+            if leader:
+                break
+            span["cache"] = "coalesced"
+            span["bytes_out"] = 0
+            try:
+                for fragment in flight.follow():
+                    span["bytes_out"] += len(fragment)
+                    yield fragment
+                return
+            except FlightCancelled:
+                if span["bytes_out"]:
+                    raise
+                # The leading session gave up before sending anything; make the request ourselves
+
+        with flights.lead(("tts", key), flight):
+            cache = get_audio_cache()
+            audio = cache.get(key)
+            span["cache"] = "miss" if audio is None else "hit"
+            if audio is not None:
+                span["bytes_out"] = len(audio)
+                flight.publish(audio)
+                yield audio
+                return
+
+            headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+            data = {"model": model, "input": text, "voice": voice_key, "response_format": response_format}
+            started = time.monotonic()
+            received = bytearray()
+            with admitted_post("lemonfox", len(text), LEMONFOX_API_URL, headers=headers, json=data,
+                               timeout=timeout, stream=True) as response:
+                span["status"] = response.status_code
+                response.raise_for_status()
+                for fragment in response.iter_content(chunk_size=STREAM_READ_BYTES):
+                    if not received:
+                        span["first_byte_ms"] = round((time.monotonic() - started) * 1000, 1)
+                    received += fragment
+                    flight.publish(fragment)
+                    yield fragment
+            span["bytes_out"] = len(received)
+            cache.put(key, bytes(received), synth_seconds=time.monotonic() - started, chars=len(text))
+
+
+def cached_chunk_count(text, voice_key, model=TTS_MODEL, response_format="mp3"):
+    """Returns (chunks already in the audio cache, total chunks) for a long-document conversion."""
+    keys = [make_cache_key(normalize_text(chunk), voice_key, model, response_format) for chunk in split_text_into_chunks(text)]
+    return len(get_audio_cache().cached_keys(keys)), len(keys)
+
+
+def cache_stats():
+    """Returns the shared audio cache counters (hits, misses, evictions, savings)."""
+    return get_audio_cache().stats()
+
+
+# --- Long-document synthesis ---
+def _is_chunk_boundary(sentence, odds=TTS_CHUNK_BOUNDARY_ODDS):
+    """Whether a chunk may end after `sentence`. Depends only on the sentence itself (crc32 is
+    stable across processes, unlike hash()), so the same text always yields the same boundaries."""
+    return zlib.crc32(sentence.encode("utf-8")) % max(1, odds) == 0
+
+
+def split_text_into_chunks(text, max_chars=TTS_CHUNK_CHARS, min_chars=TTS_CHUNK_MIN_CHARS):
+    """Splits text into chunks of at most `max_chars`, cut only between sentences (or, for a
+    run-on sentence, between words). Text shorter than `min_chars` stays one request.
+
+    Once a chunk holds `min_chars`, it ends at the next paragraph break or at a sentence picked
+    by _is_chunk_boundary. Boundaries therefore follow the content rather than character
+    offsets: editing one sentence changes the chunk containing it (occasionally also the next),
+    while every other chunk keeps its exact text and is served from the audio cache. A short
+    remainder at the end joins the chunk before it when it fits, rather than being sent alone.
+    """
+    text = normalize_text(text)
+    min_chars = min(min_chars, max_chars)
+    if len(text) < min_chars:
+        return [text] if text else []
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        for sentence in SENTENCE_END.split(paragraph):
+            sentence = sentence.strip()
+            while len(sentence) > max_chars:  # A single run-on "sentence" longer than a chunk
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append((sentence[:cut].strip(), " "))
+                sentence = sentence[cut:].strip()
+            if sentence:
+                pieces.append((sentence, " "))
+        if pieces:
+            pieces[-1] = (pieces[-1][0], "\n\n")
+
+    chunks, current, last_separator = [], "", " "
+    for piece, separator in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current.strip())
+            current, last_separator = "", current[-1:]
+        current += piece + separator
+        if len(current) >= min_chars and (separator == "\n\n" or _is_chunk_boundary(piece)):
+            chunks.append(current.strip())
+            current, last_separator = "", separator
+    if current.strip():
+        if chunks and len(current) < min_chars and len(chunks[-1]) + len(current) + 1 <= max_chars:
+            chunks[-1] += ("\n\n" if last_separator.endswith("\n") else " ") + current.strip()
+        else:
+            chunks.append(current.strip())
+    return chunks
+
+
+def _is_retryable(error):
+    """Timeouts, dropped connections and 5xx. A 429/503 has already been waited out and retried
+    by rate_limiter.admitted_post; retrying it here again would re-send and re-charge the chunk."""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 and status not in THROTTLE_STATUSES
+    return False
+
+
+def _synthesize_chunk_with_retry(chunk, voice_key, api_key, model, response_format, timeout, retries):
+    for attempt in range(retries + 1):
+        try:
+            return synthesize_speech(chunk, voice_key, api_key, model=model,
+                                     response_format=response_format, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            time.sleep(2 ** attempt)
+
+
+def synthesize_long_speech(text, voice_key, api_key, model=TTS_MODEL, response_format="mp3", timeout=60,
+                           max_workers=TTS_MAX_WORKERS, retries=TTS_CHUNK_RETRIES, progress_callback=None):
+    """Synthesizes text of any length by splitting it into chunks, synthesizing them concurrently
+    and stitching the audio back together in order.
+
+    Each chunk is retried independently and cached on success, so a failed document can be
+    retried without paying for the chunks that already succeeded. `progress_callback(done, total)`
+    is called from the calling thread, so it may safely update Streamlit elements.
+    Raises requests.exceptions.RequestException if any chunk still fails after its retries.
+    """
+    with trace("tts_long", voice=voice_key, model=model, chars_in=len(text)) as span:
+        chunks = split_text_into_chunks(text)
+        span["chunks"] = len(chunks)
+        if len(chunks) <= 1:
+            audio = synthesize_speech(text, voice_key, api_key, model=model,
+                                      response_format=response_format, timeout=timeout)
+            if progress_callback:
+                progress_callback(1, 1)
+            return audio
+
+        parts = [None] * len(chunks)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            futures = {
+                executor.submit(_synthesize_chunk_with_retry, chunk, voice_key, api_key,
+                                model, response_format, timeout, retries): index
+                for index, chunk in enumerate(chunks)
+            }
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    parts[futures[future]] = future.result()
+                    if progress_callback:
+                        progress_callback(done, len(chunks))
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        audio = join_audio(parts, response_format)
+        span["bytes_out"] = len(audio)
+        return audio
+
+
+def _stream_chunk_with_retry(chunk, voice_key, api_key, model, response_format, timeout, retries):
+    """Streams one chunk, retrying only while nothing has been yielded yet."""
+    for attempt in range(retries + 1):
+        yielded = False
+        try:
+            for fragment in stream_speech(chunk, voice_key, api_key, model=model,
+                                          response_format=response_format, timeout=timeout):
+                yielded = True
+                yield fragment
+            return
+        except requests.exceptions.RequestException as e:
+            if yielded or attempt == retries or not _is_retryable(e):
+                raise
+            time.sleep(2 ** attempt)
+
+
+def stream_long_speech(text, voice_key, api_key, model=TTS_MODEL, response_format="mp3", timeout=60,
+                       max_workers=TTS_MAX_WORKERS, retries=TTS_CHUNK_RETRIES, progress_callback=None):
+    """Streaming counterpart of synthesize_long_speech: yields audio bytes in playback order.
+
+    The first chunk is streamed as it arrives while the remaining chunks are synthesized
+    concurrently in the background, so playback can begin after the first few frames.
+    Joining everything yielded gives the same bytes as synthesize_long_speech.
+    """
+    with trace("tts_long_stream", voice=voice_key, model=model, chars_in=len(text)) as span:
+        chunks = split_text_into_chunks(text)
+        span["chunks"] = len(chunks)
+        if not chunks:
+            return
+        first = _stream_chunk_with_retry(chunks[0], voice_key, api_key, model, response_format, timeout, retries)
+        if len(chunks) == 1:
+            yield from first
+            if progress_callback:
+                progress_callback(1, 1)
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks) - 1))) as executor:
+            futures = [
+                executor.submit(_synthesize_chunk_with_retry, chunk, voice_key, api_key,
+                                model, response_format, timeout, retries)
+                for chunk in chunks[1:]
+            ]
+            stitcher = _STITCHERS[response_format]()
+            try:
+                yield from stitcher.stream(first)
+                if progress_callback:
+                    progress_callback(1, len(chunks))
+                for done, future in enumerate(futures, start=2):
+                    yield b"".join(stitcher.stream([future.result()]))
+                    if progress_callback:
+                        progress_callback(done, len(chunks))
+                tail = stitcher.finish()  # e.g. the Ogg page that ends the stream
+                if tail:
+                    yield tail
+            finally:
+                for future in futures:
+                    future.cancel()
+                # A worker with the same text as the first chunk follows its flight, so end that
+                # flight before the executor waits for the workers (else an early close deadlocks)
+                first.close()
+
+
+# --- Pipelined synthesis of text that is still being generated ---
+def _speakable_segments(text_fragments, min_chars=PIPELINE_MIN_CHARS):
+    """Yields a complete segment, or None, after each incoming text fragment.
+
+    The first sentence is released as soon as it is complete so speech can start early;
+    later sentences are batched into segments of at least `min_chars` to limit request count.
+    """
+    buffer = ""
+    first = True
+    for fragment in text_fragments:
+        buffer += fragment
+        boundaries = list(SENTENCE_END.finditer(buffer))
+        boundary = boundaries[-1].end() if boundaries else 0
+        if boundary and (first or boundary >= min_chars):
+            yield buffer[:boundary].strip()
+            buffer = buffer[boundary:]
+            first = False
+        else:
+            yield None
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def pipeline_speech(text_fragments, voice_key, api_key, model=TTS_MODEL, response_format="mp3", timeout=60,
+                    max_workers=TTS_MAX_WORKERS, retries=TTS_CHUNK_RETRIES):
+    """Yields audio, in order, for text that is still being generated (e.g. a streamed description).
+
+    Whole sentences are sent to TTS as soon as they are complete, while the rest of the
+    text is still arriving, so time-to-first-word is one sentence of generation plus one
+    short synthesis rather than the full description plus the full synthesis.
+    """
+    with trace("tts_pipeline", voice=voice_key, model=model) as span:
+        pending = deque()
+        stitcher = _STITCHERS[response_format]()
+        span["chunks"] = span["chars_in"] = 0
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            try:
+                for segment in _speakable_segments(text_fragments):
+                    for chunk in split_text_into_chunks(segment) if segment else []:
+                        span["chunks"] += 1
+                        span["chars_in"] += len(chunk)
+                        pending.append(executor.submit(_synthesize_chunk_with_retry, chunk, voice_key, api_key,
+                                                       model, response_format, timeout, retries))
+                    while pending and pending[0].done():
+                        yield b"".join(stitcher.stream([pending.popleft().result()]))
+                while pending:
+                    yield b"".join(stitcher.stream([pending.popleft().result()]))
+                tail = stitcher.finish()
+                if tail:
+                    yield tail
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+# --- Stitching clips into one file ---
+# --- MP3 ---
+MP3_BITRATES_KBPS = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1 Layer III
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],  # MPEG-2/2.5 Layer III
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _strip_id3(data):
+    """Removes a leading ID3v2 tag and a trailing ID3v1 tag, if present."""
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        size += 20 if data[5] & 0x10 else 10
+        data = data[size:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+def _mp3_frame_length(header):
+    """Returns the byte length of the Layer III frame starting with `header`, or None."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = MP3_BITRATES_KBPS[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version_bits][rate_index]
+    padding = (header[2] >> 1) & 0x01
+    return (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+
+
+def _strip_info_frame(data):
+    """Drops a leading Xing/Info/VBRI frame, whose frame count would only describe this one part."""
+    frame_length = _mp3_frame_length(data[:4])
+    if frame_length and any(tag in data[4:frame_length] for tag in (b"Xing", b"Info", b"VBRI")):
+        return data[frame_length:]
+    return data
+
+
+def _strip_mp3_stream(fragments):
+    """Streaming version of _strip_info_frame(_strip_id3(...)) for a clip that arrives in pieces."""
+    buffer = bytearray()
+    header_done = False
+    for fragment in fragments:
+        buffer += fragment
+        if not header_done:
+            if len(buffer) < 10:
+                continue
+            header_length = 0
+            if buffer[:3] == b"ID3":
+                header_length = ((buffer[6] << 21) | (buffer[7] << 14) | (buffer[8] << 7) | buffer[9])
+                header_length += 20 if buffer[5] & 0x10 else 10
+            frame_length = _mp3_frame_length(buffer[header_length:header_length + 4]) or 0
+            if len(buffer) < header_length + max(frame_length, 4):
+                continue
+            buffer = bytearray(_strip_info_frame(bytes(buffer[header_length:])))
+            header_done = True
+        if len(buffer) > 128:  # Hold back a possible trailing ID3v1 tag
+            yield bytes(buffer[:-128])
+            del buffer[:-128]
+    tail = bytes(buffer)
+    if not header_done:
+        tail = _strip_info_frame(_strip_id3(tail))
+    elif len(tail) >= 128 and tail[-128:-125] == b"TAG":
+        tail = tail[:-128]
+    yield tail
+
+
+def join_mp3(parts):
+    """Concatenates MP3 clips into a single playable stream."""
+    if len(parts) == 1:
+        return parts[0]
+    return b"".join(_strip_info_frame(_strip_id3(part)) for part in parts)
+
+
+# --- Ogg Opus ---
+def _ogg_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+        table.append(crc)
+    return table
+
+
+OGG_CRC_TABLE = _ogg_crc_table()
+
+
+def _ogg_crc(data):
+    """Ogg's page checksum: CRC-32 with polynomial 0x04C11DB7, not reflected, no initial or final XOR."""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ OGG_CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+
+def _ogg_page_length(buffer):
+    """Byte length of the Ogg page at the start of `buffer`, or None if its header is incomplete."""
+    if len(buffer) < 27:
+        return None
+    if buffer[:4] != b"OggS":
+        raise ValueError("Audio is not an Ogg stream")
+    segments = buffer[26]
+    if len(buffer) < 27 + segments:
+        return None
+    return 27 + segments + sum(buffer[27:27 + segments])
+
+
+def _opus_packet_samples(head):
+    """Samples (at 48 kHz) decoded from an Opus packet, from its first two bytes (RFC 6716, 3.1)."""
+    if not head:
+        return 0
+    config = head[0] >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config % 4]  # SILK: 10, 20, 40, 60 ms
+    elif config < 16:
+        frame = (480, 960)[config % 2]  # Hybrid: 10, 20 ms
+    else:
+        frame = (120, 240, 480, 960)[config % 4]  # CELT: 2.5, 5, 10, 20 ms
+    code = head[0] & 0x03
+    frames = 1 if code == 0 else 2 if code in (1, 2) else (head[1] & 0x3F if len(head) > 1 else 0)
+    return frame * frames
+
+
+class OggOpusStitcher:
+    """Joins Ogg Opus clips into one logical stream, page by page as their bytes arrive.
+
+    Each clip is a separate Ogg stream, and browsers do not reliably play chained streams,
+    so later clips lose their two header packets (OpusHead, OpusTags) and their pages are
+    renumbered into the first clip's stream. Granule positions carry on from the samples
+    actually decoded so far, which includes each later clip's pre-skip and any end trimming
+    of the clip before it. The newest page is held back until the next one arrives, so
+    finish() can write it as the end of the stream.
+    """
+
+    def __init__(self):
+        self.serial = None
+        self.sequence = 0
+        self.granule_offset = 0  # Samples decoded from all earlier clips
+        self.decoded = 0  # Samples decoded so far, including the current clip
+        self._packet_head = bytearray()  # First bytes of the audio packet in progress
+        self._held = None  # (page, granule if it ends the stream, granule otherwise)
+
+    def stream(self, fragments):
+        """Yields the pages of one clip, rewritten to continue the stream so far (all but the newest)."""
+        keep_headers = self.serial is None
+        headers_left = 2
+        buffer = bytearray()
+        for fragment in fragments:
+            buffer += fragment
+            while True:
+                page_length = _ogg_page_length(buffer)
+                if page_length is None or len(buffer) < page_length:
+                    break
+                page = bytearray(buffer[:page_length])
+                del buffer[:page_length]
+                lacing = page[27:27 + page[26]]
+                if headers_left:
+                    # Header packets end on page boundaries: count the packets each page completes
+                    headers_left = max(0, headers_left - sum(1 for value in lacing if value < 255))
+                    if not keep_headers:
+                        continue
+                else:
+                    self._count_samples(page, lacing)
+                held = self._hold(page)
+                if held:
+                    yield held
+        self._packet_head.clear()
+        self.granule_offset = self.decoded
+
+    def finish(self):
+        """The last page, marked as the end of the stream (b"" if nothing was streamed)."""
+        if self._held is None:
+            return b""
+        page, final_granule, _ = self._held
+        self._held = None
+        return self._write(page, final_granule, end_of_stream=True)
+
+    def _count_samples(self, page, lacing):
+        position = 27 + len(lacing)
+        for value in lacing:
+            if len(self._packet_head) < 2:
+                self._packet_head += page[position:position + min(value, 2 - len(self._packet_head))]
+            position += value
+            if value < 255:  # The packet ends in this segment
+                self.decoded += _opus_packet_samples(self._packet_head)
+                self._packet_head.clear()
+
+    def _hold(self, page):
+        """Holds `page` back and returns the previously held one, written as a mid-stream page (or None)."""
+        granule, serial = struct.unpack_from("<qI", page, 6)
+        if self.serial is None:
+            self.serial = serial
+        if granule == -1:  # No packet ends on this page
+            held = (page, -1, -1)
+        else:
+            # In the stream's last page the clip's own granule keeps its end trimming; mid-stream,
+            # a page's granule must equal the samples decoded by its end
+            held = (page, granule + self.granule_offset, granule if self.decoded == 0 else self.decoded)
+        previous, self._held = self._held, held
+        if previous is None:
+            return None
+        return self._write(previous[0], previous[2], end_of_stream=False)
+
+    def _write(self, page, granule, end_of_stream):
+        flags = (page[5] & ~0x04) | (0x04 if end_of_stream else 0)
+        sequence = self.sequence
+        self.sequence += 1
+        if (page[5], struct.unpack_from("<qII", page, 6)) == (flags, (granule, self.serial, sequence)):
+            return bytes(page)
+        page[5] = flags
+        struct.pack_into("<qIII", page, 6, granule, self.serial, sequence, 0)
+        struct.pack_into("<I", page, 22, _ogg_crc(page))
+        return bytes(page)
+
+
+class _Mp3Stitcher:
+    def stream(self, fragments):
+        yield from _strip_mp3_stream(fragments)
+
+    def finish(self):
+        return b""
+
+
+class _AdtsStitcher:
+    """AAC as the API returns it (ADTS): every frame carries its own header, so clips simply concatenate."""
+
+    def stream(self, fragments):
+        yield from fragments
+
+    def finish(self):
+        return b""
+
+
+_STITCHERS = {"mp3": _Mp3Stitcher, "aac": _AdtsStitcher, "opus": OggOpusStitcher}
+
+
+def join_audio(parts, response_format="mp3"):
+    """Concatenates clips of one format (see AUDIO_FORMATS) into a single playable file."""
+    if len(parts) == 1:
+        return parts[0]
+    stitcher = _STITCHERS[response_format]()
+    return b"".join(b"".join(stitcher.stream([part])) for part in parts) + stitcher.finish()